@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""Benchmark API throughput across uvicorn worker counts.
+
+Starts the app with 1, 2, 4 ... workers (up to the number of cores), drives it
+with a keep-alive HTTP load generator and reports requests per second for each
+worker count. After each run it toggles an exercise through one connection and
+measures how long it takes until every worker serves the updated weekly
+progress, which is bounded by CACHE_SYNC_INTERVAL.
+
+Requires MONGO_URL and DB_NAME (backend/.env is loaded by the app).
+
+    python benchmarks/bench_workers.py --duration 10 --concurrency 64
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_PATHS = ["/api/workout", "/api/workout/1", "/api/progress/weekly", "/api/progress/monthly"]
+
+
+async def http_request(reader, writer, method, path, body=None):
+    payload = json.dumps(body).encode() if body is not None else b""
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: bench\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload
+    )
+    await writer.drain()
+    head = await reader.readuntil(b"\r\n\r\n")
+    status = int(head.split(b" ", 2)[1])
+    length = 0
+    for line in head.split(b"\r\n"):
+        if line.lower().startswith(b"content-length:"):
+            length = int(line.split(b":", 1)[1])
+    return status, await reader.readexactly(length)
+
+
+async def run_load(port, paths, concurrency, duration):
+    deadline = time.perf_counter() + duration
+    counts = {"ok": 0, "errors": 0}
+
+    async def worker(index):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        i = index
+        while time.perf_counter() < deadline:
+            status, _ = await http_request(reader, writer, "GET", paths[i % len(paths)])
+            counts["ok" if status == 200 else "errors"] += 1
+            i += 1
+        writer.close()
+
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    return counts
+
+
+async def measure_invalidation(port, connections=16, timeout=30.0):
+    """Seconds until every connection sees a write made through another one"""
+    streams = [await asyncio.open_connection("127.0.0.1", port) for _ in range(connections)]
+    for r, w in streams:
+        await http_request(r, w, "GET", "/api/progress/weekly")
+    today = datetime.now().strftime("%Y-%m-%d")
+    reader, writer = streams[0]
+    _, body = await http_request(reader, writer, "GET", f"/api/workout-session/{today}/1")
+    session = json.loads(body)
+    completed = not session["completed"]
+    for exercise in session["exercises"]:
+        await http_request(reader, writer, "PATCH", f"/api/workout-session/{today}/1/exercise",
+                           {"exercise_name": exercise["exercise_name"], "completed": completed})
+    written_at = time.perf_counter()
+
+    # The writing worker invalidated its own cache, so its answer is current
+    _, body = await http_request(reader, writer, "GET", "/api/progress/weekly")
+    expected = json.loads(body)["completed_workouts"]
+    while time.perf_counter() - written_at < timeout:
+        bodies = [json.loads((await http_request(r, w, "GET", "/api/progress/weekly"))[1]) for r, w in streams]
+        if all(b["completed_workouts"] == expected for b in bodies):
+            break
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - written_at
+    for _, w in streams:
+        w.close()
+    return elapsed
+
+
+async def wait_ready(port, timeout=30.0):
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            status, _ = await http_request(reader, writer, "GET", "/api/")
+            writer.close()
+            if status == 200:
+                return
+        except OSError:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError("server did not become ready")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count())
+    parser.add_argument("--path", action="append", dest="paths")
+    args = parser.parse_args()
+    paths = args.paths or DEFAULT_PATHS
+
+    worker_counts = []
+    n = 1
+    while n <= args.max_workers:
+        worker_counts.append(n)
+        n *= 2
+    if worker_counts[-1] != args.max_workers:
+        worker_counts.append(args.max_workers)
+
+    results = []
+    for workers in worker_counts:
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "server:app", "--port", str(args.port),
+             "--workers", str(workers), "--log-level", "warning"],
+            cwd=BACKEND_DIR,
+        )
+        try:
+            asyncio.run(wait_ready(args.port))
+            counts = asyncio.run(run_load(args.port, paths, args.concurrency, args.duration))
+            delay = asyncio.run(measure_invalidation(args.port))
+        finally:
+            proc.terminate()
+            proc.wait()
+        rps = counts["ok"] / args.duration
+        results.append((workers, rps, counts["errors"], delay))
+
+    base = results[0][1] or 1.0
+    print(f"{'workers':>8} {'req/s':>10} {'speedup':>8} {'errors':>7} {'invalidation':>13}")
+    for workers, rps, errors, delay in results:
+        print(f"{workers:>8} {rps:>10.0f} {rps / base:>7.2f}x {errors:>7} {delay:>12.2f}s")
+
+
+if __name__ == "__main__":
+    main()
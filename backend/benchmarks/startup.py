@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""Measure import time and time to first request of the API.
+
+Runs `python -X importtime -c "import server"` and prints the modules with the
+largest cumulative import time, then starts uvicorn several times and reports
+how long it takes from process start until GET /api/ answers. Exits with
+status 1 when the median time to first request exceeds --budget-ms or when
+server itself imports one of the --forbid modules, which are meant to be
+imported lazily on first use.
+
+Startup only waits for MongoDB to ensure the two unique indexes (the others
+are built in the background), so this needs a reachable database; MONGO_URL
+and DB_NAME default to localhost (backend/.env is loaded by the app).
+
+    python benchmarks/startup.py --runs 5 --budget-ms 2500
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_FORBIDDEN = ["PIL", "boto3", "pandas", "numpy", "cryptography", "cProfile"]
+
+
+def import_profile():
+    """(module, self_us, cumulative_us, depth) for every module imported by server.
+    
+    -X importtime prints a module after everything it imports, so server's
+    imports are the deeper rows right before its own.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import server"],
+        cwd=BACKEND_DIR, capture_output=True, text=True, env=benchmark_env(),
+    )
+    if result.returncode != 0:
+        sys.exit(f"import server failed:\n{result.stderr}")
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(self_us), int(cumulative_us), (len(name) - len(name.lstrip())) // 2))
+    end = next(i for i, row in enumerate(rows) if row[0] == "server" and row[3] == 0)
+    start = end
+    while start > 0 and rows[start - 1][3] > 0:
+        start -= 1
+    return rows[start:end + 1]
+
+
+def benchmark_env():
+    env = dict(os.environ)
+    env.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    env.setdefault("DB_NAME", "habit_tracker")
+    # Background jobs are irrelevant to startup and would only add noise
+    env.setdefault("SCHEDULER_ENABLED", "false")
+    return env
+
+
+def http_get(port, path):
+    with socket.create_connection(("127.0.0.1", port), timeout=1.0) as sock:
+        sock.sendall(f"GET {path} HTTP/1.1\r\nHost: bench\r\nConnection: close\r\n\r\n".encode())
+        return int(sock.recv(64).split(b" ", 2)[1])
+
+
+def time_to_first_request(port, timeout):
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=benchmark_env(),
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if proc.poll() is not None:
+                sys.exit(f"uvicorn exited with status {proc.returncode}")
+            try:
+                if http_get(port, "/api/") == 200:
+                    return time.perf_counter() - started
+            except OSError:
+                pass
+            time.sleep(0.005)
+        sys.exit(f"server did not answer within {timeout:.0f}s")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--budget-ms", type=float, default=float(os.environ.get("STARTUP_BUDGET_MS", "2500")))
+    parser.add_argument("--top", type=int, default=15, help="Modules to list in the import profile")
+    parser.add_argument("--forbid", action="append", help="Module that must not be imported at startup")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args()
+    forbidden = args.forbid or DEFAULT_FORBIDDEN
+
+    rows = import_profile()
+    server_us = rows[-1][2]
+    print(f"import server: {server_us / 1000:.0f} ms")
+    print(f"{'cumulative':>11} {'self':>8}  module")
+    # Modules server imports itself, with everything they pull in
+    direct = [row for row in rows if row[3] == 1]
+    for name, self_us, cumulative_us, _ in sorted(direct, key=lambda row: -row[2])[:args.top]:
+        print(f"{cumulative_us / 1000:>9.1f}ms {self_us / 1000:>6.1f}ms  {name}")
+
+    # Only server's own imports: drivers may import e.g. cryptography themselves
+    imported = {name.split(".")[0] for name, *_ in direct}
+    eager = [module for module in forbidden if module in imported]
+
+    timings = [time_to_first_request(args.port, args.timeout) * 1000 for _ in range(args.runs)]
+    median = statistics.median(timings)
+    print(f"\ntime to first request: median {median:.0f} ms, "
+          f"min {min(timings):.0f} ms, max {max(timings):.0f} ms over {args.runs} runs "
+          f"(budget {args.budget_ms:.0f} ms)")
+
+    failed = False
+    if eager:
+        print(f"FAIL: imported at startup, should be lazy: {', '.join(eager)}")
+        failed = True
+    if median > args.budget_ms:
+        print(f"FAIL: time to first request {median:.0f} ms exceeds budget {args.budget_ms:.0f} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""Show which replica set member serves the Mongo commands of each route.
+
+Run against the local replica set from start_replica_set.sh:
+
+    MONGO_URL="mongodb://localhost:27017,localhost:27018,localhost:27019/?replicaSet=rs0" \\
+        python scripts/check_read_routing.py
+
+Progress, streak and calendar reads should land on a secondary, session reads
+and all writes on the primary.
+"""
+import sys
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+
+from pymongo import monitoring
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+class ServerRecorder(monitoring.CommandListener):
+    def __init__(self):
+        self.commands = []
+
+    def started(self, event):
+        self.commands.append((event.command_name, event.connection_id))
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+recorder = ServerRecorder()
+monitoring.register(recorder)
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import server  # noqa: E402
+
+ROUTES = [
+    ("PATCH", "/api/workout-session/{today}/1/exercise", {"exercise_name": "Hip Thrust", "completed": True}),
+    ("GET", "/api/workout-session/{today}/1", None),
+    ("GET", "/api/progress/weekly", None),
+    ("GET", "/api/progress/monthly", None),
+    ("GET", "/api/progress/streak", None),
+    ("GET", "/api/progress/calendar", None),
+]
+
+
+def main():
+    today = datetime.now().strftime("%Y-%m-%d")
+    with TestClient(server.app) as client:
+        client.get(f"/api/workout-session/{today}/1")
+        primary = client.portal.call(lambda: server.client.primary)
+        for method, path, body in ROUTES:
+            path = path.format(today=today)
+            recorder.commands.clear()
+            response = client.request(method, path, json=body)
+            members = defaultdict(list)
+            for command_name, address in recorder.commands:
+                if command_name in ("endSessions", "explain"):
+                    continue
+                role = "primary" if address == primary else "secondary"
+                members[f"{address[0]}:{address[1]} ({role})"].append(command_name)
+            print(f"{method} {path} -> {response.status_code}")
+            for member, commands in members.items():
+                print(f"    {member}: {', '.join(commands)}")
+
+
+if __name__ == "__main__":
+    main()
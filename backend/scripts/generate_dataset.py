@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""Generate realistic synthetic workout sessions for load testing.
+
+Each user follows WORKOUT_ROUTINE on a weekly schedule, rotating through the
+routine days. Attendance alternates between streaks and lapses whose lengths
+are drawn around --streak-days and --skip-days. Inside a streak a scheduled
+day is attended with probability --adherence, and an attended session
+completes each exercise with probability --exercise-completion. The same
+seed always produces the same dataset.
+
+Documents are serialized with server.session_to_document, so they follow
+SESSION_STORAGE_FORMAT. They are either bulk inserted into DB_NAME or written
+as NDJSON (extended JSON, loadable with mongoimport):
+
+    python scripts/generate_dataset.py --users 10 --years 3 --seed 7
+    python scripts/generate_dataset.py --users 10 --output sessions.ndjson
+
+Generated sessions get revisions above counters.session_revision so delta
+sync clients receive them. When inserting, the counter is read and advanced
+here. For NDJSON the starting revision comes from --start-revision, or from
+the counter when MONGO_URL is configured, and the counter update to apply
+after the import is printed.
+
+The API is single-user. With --users > 1 every document carries a user_id,
+and route lookups by (date, workout_day) will see one of the users' sessions.
+That is intended for volume and index testing, not for checking results.
+"""
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Optional
+
+import typer
+from dotenv import load_dotenv
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+# server needs a Mongo URL at import time even when only writing NDJSON
+load_dotenv(BACKEND_DIR / '.env')
+MONGO_CONFIGURED = 'MONGO_URL' in os.environ
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'habit_tracker')
+
+from server import (  # noqa: E402
+    WORKOUT_ROUTINE,
+    ExerciseCompletion,
+    WorkoutSession,
+    calculate_completion_percentage,
+    is_workout_complete,
+    session_to_document,
+)
+
+WEEKDAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+
+app = typer.Typer(add_completion=False)
+
+
+def parse_schedule(schedule):
+    days = [day.strip().lower()[:3] for day in schedule.split(",") if day.strip()]
+    unknown = [day for day in days if day not in WEEKDAYS]
+    if unknown or not days:
+        raise typer.BadParameter(f"expected weekday names like mon,wed,fri, got {schedule!r}")
+    return {WEEKDAYS.index(day) for day in days}
+
+
+def generate_user_sessions(rng, start, end, schedule, adherence, exercise_completion,
+                           streak_days, skip_days):
+    """Yield the WorkoutSessions of one user between start and end inclusive"""
+    routine_days = sorted(WORKOUT_ROUTINE)
+    next_routine = rng.randrange(len(routine_days))
+    # Two-state chain: each day a streak ends with probability 1/streak_days,
+    # a lapse with probability 1/skip_days
+    in_streak = rng.random() < streak_days / (streak_days + skip_days)
+
+    day = start
+    while day <= end:
+        if in_streak and rng.random() < 1 / streak_days:
+            in_streak = False
+        elif not in_streak and rng.random() < 1 / skip_days:
+            in_streak = True
+
+        if day.weekday() in schedule and in_streak and rng.random() < adherence:
+            workout_day = routine_days[next_routine]
+            next_routine = (next_routine + 1) % len(routine_days)
+            routine = WORKOUT_ROUTINE[workout_day]
+
+            started = datetime(day.year, day.month, day.day, rng.randint(6, 20), rng.randrange(60))
+            exercise_time = started
+            exercises = []
+            for ex in routine["exercises"]:
+                exercise_time += timedelta(minutes=rng.randint(6, 15))
+                completed = rng.random() < exercise_completion
+                exercises.append(ExerciseCompletion(
+                    exercise_name=ex["name"],
+                    completed=completed,
+                    timestamp=exercise_time if completed else None
+                ))
+
+            yield WorkoutSession(
+                id=str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+                date=day.strftime('%Y-%m-%d'),
+                workout_day=workout_day,
+                workout_name=routine["name"],
+                exercises=exercises,
+                completed=is_workout_complete(exercises),
+                completion_percentage=calculate_completion_percentage(exercises),
+                timestamp=started,
+                updated_at=exercise_time
+            )
+        day += timedelta(days=1)
+
+
+def extended_json(value):
+    """json.dumps default emitting datetimes as MongoDB extended JSON ($date)"""
+    if isinstance(value, datetime):
+        return {"$date": value.strftime('%Y-%m-%dT%H:%M:%S.') + f"{value.microsecond // 1000:03d}Z"}
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def read_revision_counter(db):
+    counter = db.counters.find_one({"_id": "session_revision"})
+    return counter["value"] if counter else 0
+
+
+def bump_derived_versions(db, months):
+    """Make running servers drop caches derived from the sessions just written"""
+    for namespace in ["sessions", "archive", *(f"calendar:{month}" for month in sorted(months))]:
+        db.cache_versions.update_one({"_id": namespace}, {"$inc": {"version": 1}}, upsert=True)
+
+
+@app.command()
+def generate(
+    users: int = typer.Option(1, min=1, help="Number of users to generate"),
+    years: float = typer.Option(2.0, min=0.1, help="Years of history ending at --end"),
+    end: Optional[str] = typer.Option(None, help="Last day (YYYY-MM-DD), defaults to today"),
+    seed: int = typer.Option(42, help="Random seed; the same seed gives the same dataset"),
+    schedule: str = typer.Option("mon,tue,wed,thu,fri", help="Gym weekdays"),
+    adherence: float = typer.Option(0.85, min=0.0, max=1.0, help="Chance of attending a scheduled day during a streak"),
+    exercise_completion: float = typer.Option(0.9, min=0.0, max=1.0, help="Chance of completing each exercise"),
+    streak_days: float = typer.Option(45.0, min=1.0, help="Mean length of an attendance streak in days"),
+    skip_days: float = typer.Option(7.0, min=1.0, help="Mean length of a lapse in days"),
+    output: Optional[Path] = typer.Option(None, help="Write NDJSON here instead of inserting into Mongo"),
+    batch_size: int = typer.Option(5000, min=1, help="Documents per insert_many"),
+    drop: bool = typer.Option(False, help="Drop workout_sessions before inserting"),
+    start_revision: Optional[int] = typer.Option(
+        None, min=0, help="Revision to number sessions after; defaults to counters.session_revision"
+    ),
+):
+    """Generate workout sessions for --users users over --years years"""
+    end_date = date.fromisoformat(end) if end else date.today()
+    start_date = end_date - timedelta(days=round(years * 365.25))
+    gym_days = parse_schedule(schedule)
+
+    db = None
+    revision = start_revision
+    if output is None:
+        db = MongoClient(os.environ['MONGO_URL'])[os.environ['DB_NAME']]
+        if drop:
+            db.workout_sessions.drop()
+        if revision is None:
+            revision = read_revision_counter(db)
+    elif revision is None:
+        if not MONGO_CONFIGURED:
+            raise typer.BadParameter(
+                "pass --start-revision (the target's counters.session_revision) or set MONGO_URL",
+                param_hint="--start-revision"
+            )
+        try:
+            target = MongoClient(os.environ['MONGO_URL'], serverSelectionTimeoutMS=5000)
+            revision = read_revision_counter(target[os.environ['DB_NAME']])
+        except PyMongoError as e:
+            raise typer.BadParameter(
+                f"could not read the revision counter ({e}); pass --start-revision",
+                param_hint="--start-revision"
+            )
+
+    sink = open(output, "w") if output else None
+    started = time.perf_counter()
+    written = 0
+    months = set()
+    batch = []
+
+    def flush():
+        if not batch:
+            return
+        if sink:
+            # bson.json_util is several times slower for these flat documents
+            sink.write("\n".join(json.dumps(doc, default=extended_json) for doc in batch) + "\n")
+        else:
+            db.workout_sessions.insert_many(batch, ordered=False)
+        batch.clear()
+
+    try:
+        for index in range(users):
+            user_id = f"user-{index + 1:05d}"
+            # Seeded per user so adding users does not change existing ones
+            rng = random.Random(f"{seed}:{user_id}")
+            for session in generate_user_sessions(
+                rng, start_date, end_date, gym_days, adherence,
+                exercise_completion, streak_days, skip_days
+            ):
+                revision += 1
+                session.revision = revision
+                batch.append({**session_to_document(session), "user_id": user_id})
+                months.add(session.date[:7])
+                written += 1
+                if len(batch) >= batch_size:
+                    flush()
+        flush()
+    finally:
+        if sink:
+            sink.close()
+
+    if db is not None:
+        # Writes made through the API must get revisions above the generated ones
+        db.counters.update_one({"_id": "session_revision"}, {"$max": {"value": revision}}, upsert=True)
+        bump_derived_versions(db, months)
+
+    elapsed = time.perf_counter() - started
+    target = output or f"{os.environ['DB_NAME']}.workout_sessions"
+    typer.echo(
+        f"Wrote {written} sessions for {users} users ({start_date} to {end_date}) "
+        f"to {target} in {elapsed:.1f}s ({written / elapsed if elapsed else 0:.0f} docs/s)"
+    )
+    if sink:
+        typer.echo(
+            "After importing, advance the revision counter so API writes get newer revisions:\n"
+            f'  db.counters.updateOne({{_id: "session_revision"}}, {{$max: {{value: {revision}}}}}, {{upsert: true}})'
+        )
+
+
+if __name__ == "__main__":
+    app()
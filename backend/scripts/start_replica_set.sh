@@ -0,0 +1,48 @@
+#!/usr/bin/env bash
+# Start a local three-member replica set on one host for testing read routing.
+#
+#   ./scripts/start_replica_set.sh            # start rs0 on ports 27017-27019
+#   ./scripts/start_replica_set.sh stop       # stop it again
+#
+# Then point the backend at it:
+#
+#   MONGO_URL="mongodb://localhost:27017,localhost:27018,localhost:27019/?replicaSet=rs0"
+#
+# Secondaries can be made to lag with:
+#   mongosh --port 27018 --eval 'db.fsyncLock()'   (and db.fsyncUnlock() after)
+set -euo pipefail
+
+REPLSET="${REPLSET:-rs0}"
+BASE_PORT="${BASE_PORT:-27017}"
+DATA_DIR="${DATA_DIR:-/tmp/gym-tracker-rs}"
+PORTS=("$BASE_PORT" "$((BASE_PORT + 1))" "$((BASE_PORT + 2))")
+
+if [[ "${1:-start}" == "stop" ]]; then
+    for port in "${PORTS[@]}"; do
+        mongod --shutdown --dbpath "$DATA_DIR/$port" || true
+    done
+    exit 0
+fi
+
+for port in "${PORTS[@]}"; do
+    mkdir -p "$DATA_DIR/$port"
+    mongod --replSet "$REPLSET" --port "$port" --bind_ip localhost \
+        --dbpath "$DATA_DIR/$port" --logpath "$DATA_DIR/$port.log" --fork
+done
+
+mongosh --quiet --port "${PORTS[0]}" --eval "
+try {
+    rs.status()
+} catch (e) {
+    rs.initiate({
+        _id: '$REPLSET',
+        members: [
+            {_id: 0, host: 'localhost:${PORTS[0]}', priority: 2},
+            {_id: 1, host: 'localhost:${PORTS[1]}'},
+            {_id: 2, host: 'localhost:${PORTS[2]}'}
+        ]
+    })
+}
+while (!db.hello().isWritablePrimary) { sleep(200) }
+print('replica set $REPLSET ready')
+"
@@ -1,26 +1,217 @@
-from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File, Form
+from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File, Form, Query, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
+import bson
+from bson import Binary, ObjectId
+from bson.errors import InvalidId
+from gridfs.errors import NoFile
+from concurrent.futures import ThreadPoolExecutor
+import io
+import zlib
+import pymongo
+from pymongo import DeleteOne, ReplaceOne, ReturnDocument, UpdateOne, monitoring
+from pymongo.errors import CollectionInvalid, DuplicateKeyError, PyMongoError
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
 import os
+import asyncio
 import logging
+import contextlib
+import contextvars
+import hmac
+import json
+import random
+import re
+import socket
+import time
+from collections import deque
 from pathlib import Path
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict
 import uuid
 from datetime import datetime, date, timedelta
 import base64
+import binascii
 import calendar
 
 # test auto deploy 2
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# Profiling and slow-query log: a request is profiled when it carries
+# X-Profile-Token matching PROFILE_TOKEN, or at random with PROFILE_SAMPLE_RATE
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN')
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_DIR = Path(os.environ.get('PROFILE_DIR', ROOT_DIR / 'profiles'))
+PROFILE_MAX_FILES = int(os.environ.get('PROFILE_MAX_FILES', '200'))  # oldest are deleted beyond this
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '100'))
+SLOW_QUERY_LOG_SIZE = int(os.environ.get('SLOW_QUERY_LOG_SIZE', '200'))
+# Slow reads explained at once; beyond this they are logged without docs_examined
+SLOW_QUERY_MAX_EXPLAINS = int(os.environ.get('SLOW_QUERY_MAX_EXPLAINS', '2'))
+
+# Route of the request being served, visible to Mongo command listeners
+current_route = contextvars.ContextVar('current_route', default=None)
+slow_query_logger = logging.getLogger('slow_queries')
+
+def command_collection(command_name, command):
+    # getMore's first field is the cursor id
+    if command_name == "getMore":
+        return command.get("collection")
+    return command.get(command_name)
+
+def command_filter(command):
+    """Filter or pipeline of a command; update and delete carry one per statement"""
+    for key in ("filter", "query", "pipeline", "q"):
+        if key in command:
+            return command[key]
+    statements = command.get("updates", command.get("deletes"))
+    if statements:
+        filters = [statement.get("q") for statement in statements]
+        return filters[0] if len(filters) == 1 else filters
+    return None
+
+class SlowQueryListener(monitoring.CommandListener):
+    """Record Mongo commands slower than SLOW_QUERY_MS with their route.
+    
+    Command events do not report how many documents the server examined, so
+    slow reads are re-run as an executionStats explain on the event loop to
+    fill in docs_examined before the entry is logged. At most
+    SLOW_QUERY_MAX_EXPLAINS run at once, so a slow database is not sent a
+    second copy of every slow query.
+    """
+    EXPLAINABLE = {"find", "aggregate", "count", "distinct"}
+    
+    def __init__(self):
+        self.pending = {}
+        self.recent = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+        self.loop = None
+        self.explaining = 0
+    
+    def started(self, event):
+        if event.command_name == "explain":
+            return
+        self.pending[(event.connection_id, event.request_id)] = (event.command, current_route.get())
+    
+    def succeeded(self, event):
+        pending = self.pending.pop((event.connection_id, event.request_id), None)
+        duration_ms = event.duration_micros / 1000
+        if pending is None or duration_ms < SLOW_QUERY_MS:
+            return
+        
+        command, route = pending
+        reply = event.reply
+        cursor = reply.get("cursor", {})
+        entry = {
+            "command": event.command_name,
+            "collection": command_collection(event.command_name, command),
+            "filter": command_filter(command),
+            "duration_ms": round(duration_ms, 2),
+            "docs_returned": len(cursor.get("firstBatch", cursor.get("nextBatch", []))) if cursor else reply.get("n"),
+            "docs_examined": None,
+            "route": route,
+            "at": datetime.utcnow().isoformat()
+        }
+        if event.command_name in self.EXPLAINABLE and self.loop is not None:
+            self.loop.call_soon_threadsafe(self.start_explain, event.database_name, command, entry)
+        else:
+            self.record(entry)
+    
+    def failed(self, event):
+        self.pending.pop((event.connection_id, event.request_id), None)
+    
+    def start_explain(self, database_name, command, entry):
+        # Runs on the event loop, so the counter needs no lock
+        if self.explaining >= SLOW_QUERY_MAX_EXPLAINS:
+            metrics["slow_query_explains_skipped"] += 1
+            self.record(entry)
+            return
+        self.explaining += 1
+        asyncio.ensure_future(self.explain(database_name, command, entry))
+    
+    async def explain(self, database_name, command, entry):
+        explained = {k: v for k, v in command.items() if not k.startswith("$") and k not in ("lsid", "txnNumber", "cursor")}
+        if explained.get("aggregate"):
+            explained["cursor"] = {}
+        try:
+            plan = await client[database_name].command({"explain": explained, "verbosity": "executionStats"})
+            stats = plan.get("executionStats") or plan.get("stages", [{}])[0].get("$cursor", {}).get("executionStats", {})
+            entry["docs_examined"] = stats.get("totalDocsExamined")
+        except Exception as e:
+            slow_query_logger.debug(f"Could not explain slow {entry['command']}: {e}")
+        finally:
+            self.explaining -= 1
+        self.record(entry)
+    
+    def record(self, entry):
+        self.recent.append(entry)
+        metrics["slow_queries"] += 1
+        slow_query_logger.warning(json.dumps(entry, default=str))
+
+slow_query_listener = SlowQueryListener()
+
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, event_listeners=[slow_query_listener])
 db = client[os.environ['DB_NAME']]
 
+# Progress, streak and calendar reads may be served by replica set secondaries
+# no more than ANALYTICS_MAX_STALENESS_SECONDS behind (the driver minimum is 90).
+# Everything else, including a user's own session reads, stays on the primary.
+ANALYTICS_READ_PREFERENCE = os.environ.get('ANALYTICS_READ_PREFERENCE', 'secondaryPreferred')
+ANALYTICS_MAX_STALENESS_SECONDS = int(os.environ.get('ANALYTICS_MAX_STALENESS_SECONDS', '90'))
+# Analytics reads taking longer than this (including waiting for a lagging
+# secondary to catch up) are retried on the primary
+ANALYTICS_MAX_TIME_MS = int(os.environ.get('ANALYTICS_MAX_TIME_MS', '2000'))
+READ_PREFERENCES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest
+}
+
+def analytics_read_preference():
+    mode = READ_PREFERENCES[ANALYTICS_READ_PREFERENCE]
+    if mode is Primary:
+        return Primary()
+    return mode(max_staleness=ANALYTICS_MAX_STALENESS_SECONDS)
+
+analytics_db = client.get_database(os.environ['DB_NAME'], read_preference=analytics_read_preference())
+
+# Session storage format: "documents" keeps one ExerciseCompletion sub-document
+# per exercise, "bitmask" stores a completion bitmask plus a parallel array of
+# timestamps indexed against the routine's exercise order. Reads accept both.
+SESSION_STORAGE_FORMAT = os.environ.get('SESSION_STORAGE_FORMAT', 'documents')
+MIGRATE_SESSION_STORAGE = os.environ.get('MIGRATE_SESSION_STORAGE', '').lower() in ('1', 'true', 'yes')
+
+# Concurrent identical GETs on these routes share one in-flight response
+REQUEST_COALESCING = os.environ.get('REQUEST_COALESCING', 'true').lower() in ('1', 'true', 'yes')
+COALESCED_ROUTES = ("/api/workout", "/api/progress/")
+
+# Workers poll the cache_versions collection this often (seconds), which bounds
+# how long a derived result cached in one worker can outlive a write in another
+CACHE_SYNC_INTERVAL = float(os.environ.get('CACHE_SYNC_INTERVAL', '1.0'))
+
+# In-process scheduler for day/week boundary jobs. Each occurrence of a
+# leader-only job is claimed by exactly one worker through scheduler_claims.
+SCHEDULER_ENABLED = os.environ.get('SCHEDULER_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+SCHEDULER_JITTER_SECONDS = float(os.environ.get('SCHEDULER_JITTER_SECONDS', '30'))
+WARM_CACHES_AT = os.environ.get('WARM_CACHES_AT', '05:30')  # local time, before the morning spike
+WORKER_ID = f"{socket.gethostname()}-{os.getpid()}"
+
+# Process-local counters exposed at /api/metrics
+metrics = {
+    "coalescing": {"requests": 0, "leaders": 0, "coalesced": 0, "in_flight": 0},
+    "cache": {"hits": 0, "misses": 0, "invalidations": 0, "syncs": 0, "sync_errors": 0},
+    "profiles": 0,
+    "slow_queries": 0,
+    "slow_query_explains_skipped": 0,
+    "analytics_primary_fallbacks": 0,
+    "scheduler": {}
+}
+
 # Create the main app without a prefix
 app = FastAPI()
 
@@ -34,6 +225,12 @@ class ExerciseCompletion(BaseModel):
     completed: bool = False
     timestamp: Optional[datetime] = None
 
+class SessionPhoto(BaseModel):
+    file_id: str  # served from /api/photos/{file_id}
+    content_type: str
+    size: int
+    thumbnails: Dict[str, str] = {}  # "<size>.<jpg|webp>" -> file_id
+
 class WorkoutSession(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     date: str  # YYYY-MM-DD format
@@ -43,6 +240,9 @@ class WorkoutSession(BaseModel):
     completed: bool = False
     completion_percentage: float = 0.0
     timestamp: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    revision: int = 0  # monotonic across all sessions, bumped on every write
+    photo: Optional[SessionPhoto] = None
 
 class WorkoutSessionCreate(BaseModel):
     date: str
@@ -52,6 +252,99 @@ class ExerciseUpdate(BaseModel):
     exercise_name: str
     completed: bool
 
+class ExerciseSetCreate(BaseModel):
+    exercise_name: str
+    weight: Optional[float] = Field(None, ge=0)  # kg
+    reps: Optional[int] = Field(None, ge=0)
+    duration_seconds: Optional[float] = Field(None, ge=0)  # holds like Plank or Wall Sit
+    timestamp: Optional[datetime] = None  # when the set was done, defaults to now
+
+class ExerciseSet(BaseModel):
+    date: str
+    workout_day: int
+    exercise_name: str
+    weight: Optional[float] = None
+    reps: Optional[int] = None
+    duration_seconds: Optional[float] = None
+    timestamp: datetime
+
+class PersonalRecord(BaseModel):
+    exercise_name: str
+    max_weight: Optional[float] = None
+    max_reps: Optional[int] = None
+    max_volume: Optional[float] = None  # weight x reps of a single set
+    max_duration_seconds: Optional[float] = None
+    achieved_on: Dict[str, str] = {}  # record name -> YYYY-MM-DD it was set
+
+class ExerciseSetResult(BaseModel):
+    set: ExerciseSet
+    personal_record: PersonalRecord
+    new_records: List[str]  # records this set improved
+
+class ExerciseHistoryPoint(BaseModel):
+    week_start: str  # Monday, YYYY-MM-DD
+    sets: int
+    max_weight: Optional[float]
+    max_reps: Optional[int]
+    max_duration_seconds: Optional[float]
+    volume: float  # sum of weight x reps
+
+class ExerciseHistory(BaseModel):
+    exercise_name: str
+    weeks: List[ExerciseHistoryPoint]
+
+class SyncUpdate(BaseModel):
+    date: str  # YYYY-MM-DD, checked per update so a bad one only rejects itself
+    workout_day: int
+    exercise_name: str
+    completed: bool
+    timestamp: Optional[datetime] = None  # when the client recorded the toggle
+
+class SyncRequest(BaseModel):
+    cursor: int = 0  # highest revision the client has already received
+    updates: List[SyncUpdate] = []
+
+class SyncRejection(BaseModel):
+    index: int
+    detail: str
+
+class SyncResponse(BaseModel):
+    cursor: int
+    sessions: List[WorkoutSession]
+    has_more: bool
+    applied: int
+    rejected: List[SyncRejection]
+
+class DailyHabits(BaseModel):
+    date: str  # YYYY-MM-DD format
+    breakfast: bool = False
+    lunch: bool = False
+    dinner: bool = False
+    gym: bool = False
+    eating_completed: bool = False
+    completed_all: bool = False
+    gym_photo: Optional[str] = None  # URL of the stored photo
+
+class DailyHabitsCreate(BaseModel):
+    date: str
+    breakfast: bool = False
+    lunch: bool = False
+    dinner: bool = False
+    gym: bool = False
+    gym_photo: Optional[str] = None  # base64 data URL
+
+class DailyHabitsUpdate(BaseModel):
+    breakfast: Optional[bool] = None
+    lunch: Optional[bool] = None
+    dinner: Optional[bool] = None
+    gym: Optional[bool] = None
+    gym_photo: Optional[str] = None  # base64 data URL, or null to remove
+
+class HabitProgress(BaseModel):
+    completed_days: int
+    total_days: int
+    percentage: float
+
 class WeeklyProgress(BaseModel):
     week_start: str
     completed_workouts: int
@@ -59,6 +352,9 @@ class WeeklyProgress(BaseModel):
     progress_percentage: float
     workout_days_completed: List[int]
     rewards_unlocked: List[str]
+    eating_progress: HabitProgress  # days with all three meals, out of 7
+    gym_progress: HabitProgress  # gym days, out of 4
+    overall_progress: float  # average of eating and gym percentages
 
 class MonthlyProgress(BaseModel):
     month: str  # YYYY-MM format
@@ -69,6 +365,13 @@ class MonthlyProgress(BaseModel):
     longest_streak: int
     rewards_unlocked: List[str]
 
+class CalendarHeatmap(BaseModel):
+    year: int
+    start: str  # YYYY-01-01, day offsets are counted from here
+    days: List[int]  # day offsets with at least one completed workout, ascending
+    counts: List[int]  # completed workouts on each listed day
+    workout_days: List[int]  # bitmask of completed workout days (bit n = day n) on each listed day
+
 class StreakInfo(BaseModel):
     current_streak: int
     longest_streak: int
@@ -296,6 +599,63 @@ WORKOUT_ROUTINE = {
     }
 }
 
+# Delta sync: a change cursor only moves past sessions written at least this
+# many seconds ago, so a write that allocated a lower revision but committed
+# later than a higher one is still picked up by the next sync
+SYNC_SETTLE_SECONDS = float(os.environ.get('SYNC_SETTLE_SECONDS', '5'))
+SYNC_PAGE_SIZE = int(os.environ.get('SYNC_PAGE_SIZE', '500'))
+
+# Gym photos are streamed into GridFS; thumbnails are rendered off the event
+# loop in a thread pool, or a process pool with THUMBNAIL_EXECUTOR=process
+MAX_PHOTO_BYTES = int(os.environ.get('MAX_PHOTO_BYTES', str(15 * 1024 * 1024)))
+PHOTO_CHUNK_SIZE = 255 * 1024
+THUMBNAIL_SIZES = (256, 1024)
+THUMBNAIL_FORMATS = {"jpg": ("JPEG", "image/jpeg"), "webp": ("WEBP", "image/webp")}
+THUMBNAIL_EXECUTOR = os.environ.get('THUMBNAIL_EXECUTOR', 'thread')
+THUMBNAIL_WORKERS = int(os.environ.get('THUMBNAIL_WORKERS', str(min(4, os.cpu_count() or 1))))
+thumbnail_executor = None
+
+# Daily habits are stored as one bitfield per day
+HABIT_FLAGS = {"breakfast": 1, "lunch": 2, "dinner": 4, "gym": 8}
+EATING_MASK = HABIT_FLAGS["breakfast"] | HABIT_FLAGS["lunch"] | HABIT_FLAGS["dinner"]
+ALL_HABITS_MASK = EATING_MASK | HABIT_FLAGS["gym"]
+WEEKLY_EATING_TARGET = 7
+WEEKLY_GYM_TARGET = 4
+
+# Rewards are unlocked per week (keyed by its Monday) or per month (YYYY-MM)
+# when a period metric reaches the threshold. Rules are evaluated whenever a
+# session's completion changes and unlocks are stored in reward_events.
+REWARD_RULES = [
+    {"id": "first_workout", "label": "🌟 First Workout!", "period": "week", "metric": "completed_workouts", "threshold": 1},
+    {"id": "getting_strong", "label": "🔥 Getting Strong!", "period": "week", "metric": "completed_workouts", "threshold": 2},
+    {"id": "almost_there", "label": "💎 Almost There!", "period": "week", "metric": "completed_workouts", "threshold": 3},
+    {"id": "workout_queen", "label": "👑 Workout Queen!", "period": "week", "metric": "completed_workouts", "threshold": 4},
+    {"id": "month_started", "label": "🎯 Month Started!", "period": "month", "metric": "completed_workouts", "threshold": 2},
+    {"id": "strong_month", "label": "💪 Strong Month!", "period": "month", "metric": "completed_workouts", "threshold": 6},
+    {"id": "excellent_month", "label": "🔥 Excellent Month!", "period": "month", "metric": "completed_workouts", "threshold": 10},
+    {"id": "amazing_month", "label": "👑 Amazing Month!", "period": "month", "metric": "completed_workouts", "threshold": 14},
+    {"id": "perfect_month", "label": "🏆 Perfect Month!", "period": "month", "metric": "progress_percentage", "threshold": 90},
+]
+REWARD_ORDER = {rule["id"]: i for i, rule in enumerate(REWARD_RULES)}
+REWARD_LABELS = {rule["id"]: rule["label"] for rule in REWARD_RULES}
+# Evaluations repeated while concurrent writes keep moving the counts
+REWARD_EVALUATION_ATTEMPTS = 3
+
+# Sets are measurements in a time-series collection, bucketed per exercise
+# and session; personal_records keeps the running maxima per exercise
+SET_RECORD_FIELDS = {
+    "max_weight": "weight",
+    "max_reps": "reps",
+    "max_volume": "volume",
+    "max_duration_seconds": "duration_seconds",
+}
+MAX_HISTORY_WEEKS = 520
+
+# Sessions older than ARCHIVE_AFTER_DAYS are packed into one zlib-compressed
+# document per month in workout_sessions_archive. The current week and month
+# are never archived, whatever the configured age.
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', '120'))
+
 # Helper functions
 def calculate_completion_percentage(exercises):
     if not exercises:
@@ -306,6 +666,1111 @@ def calculate_completion_percentage(exercises):
 def is_workout_complete(exercises):
     return all(ex.completed for ex in exercises)
 
+def routine_exercise_names(workout_day):
+    return [ex["name"] for ex in WORKOUT_ROUTINE[workout_day]["exercises"]]
+
+def full_completion_mask(workout_day):
+    return (1 << len(WORKOUT_ROUTINE[workout_day]["exercises"])) - 1
+
+def completed_session_filter():
+    """Mongo filter matching fully completed sessions in either storage format"""
+    return {"$or": [{"completed": True}] + [
+        {"workout_day": day, "completion_mask": {"$bitsAllSet": full_completion_mask(day)}}
+        for day in WORKOUT_ROUTINE
+    ]}
+
+def completion_from_mask(doc):
+    """(exercises, completed, completion_percentage) of a bitmask-format document"""
+    names = routine_exercise_names(doc["workout_day"])
+    mask = doc["completion_mask"]
+    times = doc.get("completion_times") or []
+    exercises = [
+        ExerciseCompletion(
+            exercise_name=name,
+            completed=bool(mask >> i & 1),
+            timestamp=times[i] if i < len(times) else None
+        )
+        for i, name in enumerate(names)
+    ]
+    full_mask = full_completion_mask(doc["workout_day"])
+    completed_count = bin(mask & full_mask).count("1")
+    return exercises, mask & full_mask == full_mask, (completed_count / len(names)) * 100 if names else 0.0
+
+def session_from_document(doc):
+    """Build a WorkoutSession from a stored document in either storage format"""
+    if "completion_mask" not in doc:
+        return WorkoutSession(**doc)
+    
+    exercises, completed, completion_percentage = completion_from_mask(doc)
+    return WorkoutSession(
+        id=doc["id"],
+        date=doc["date"],
+        workout_day=doc["workout_day"],
+        workout_name=doc["workout_name"],
+        exercises=exercises,
+        completed=completed,
+        completion_percentage=completion_percentage,
+        timestamp=doc["timestamp"],
+        updated_at=doc.get("updated_at", doc["timestamp"]),
+        revision=doc.get("revision", 0),
+        photo=doc.get("photo")
+    )
+
+# Stored fields each WorkoutSession field is read from, in either format
+SESSION_FIELD_SOURCES = {
+    "id": ["id"],
+    "date": ["date"],
+    "workout_day": ["workout_day"],
+    "workout_name": ["workout_name"],
+    "exercises": ["exercises", "completion_mask", "completion_times"],
+    "completed": ["completed", "completion_mask"],
+    "completion_percentage": ["completion_percentage", "completion_mask"],
+    "timestamp": ["timestamp"],
+    "updated_at": ["updated_at", "timestamp"],
+    "revision": ["revision"],
+    "photo": ["photo"],
+}
+
+def parse_fields(fields, model):
+    """Set of field names from a comma-separated `fields` parameter, or None for all"""
+    if not fields:
+        return None
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested - set(model.model_fields)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    return requested
+
+def session_projection(fields):
+    """Mongo projection loading only what `fields` of a WorkoutSession need"""
+    # workout_day decodes bitmask documents, revision is the ETag
+    projection = {"_id": 0, "workout_day": 1, "revision": 1}
+    for field in fields:
+        projection.update({source: 1 for source in SESSION_FIELD_SOURCES[field]})
+    return projection
+
+def sparse_session(doc, fields):
+    """Only `fields` of a (possibly projected) session document, as a dict"""
+    values = {}
+    if "completion_mask" in doc and fields & {"exercises", "completed", "completion_percentage"}:
+        values["exercises"], values["completed"], values["completion_percentage"] = completion_from_mask(doc)
+    sparse = {}
+    for field in WorkoutSession.model_fields:
+        if field not in fields:
+            continue
+        if field in values:
+            sparse[field] = values[field]
+        elif field == "updated_at":
+            sparse[field] = doc.get("updated_at", doc.get("timestamp"))
+        else:
+            sparse[field] = doc.get(field, WorkoutSession.model_fields[field].default)
+    return sparse
+
+def sparse_response(content, headers=None):
+    """JSON response for a partial model, which its response_model would reject"""
+    return JSONResponse(jsonable_encoder(content), headers=headers)
+
+def session_to_document(session):
+    """Serialize a WorkoutSession into the configured storage format"""
+    if SESSION_STORAGE_FORMAT != "bitmask":
+        return session.dict()
+    
+    by_name = {ex.exercise_name: ex for ex in session.exercises}
+    mask = 0
+    times = []
+    for i, name in enumerate(routine_exercise_names(session.workout_day)):
+        exercise = by_name.get(name)
+        if exercise and exercise.completed:
+            mask |= 1 << i
+        times.append(exercise.timestamp if exercise else None)
+    
+    return {
+        "id": session.id,
+        "date": session.date,
+        "workout_day": session.workout_day,
+        "workout_name": session.workout_name,
+        "completion_mask": mask,
+        "completion_times": times,
+        "timestamp": session.timestamp,
+        "updated_at": session.updated_at,
+        "revision": session.revision,
+        "photo": session.photo.dict() if session.photo else None
+    }
+
+async def migrate_session_storage(batch_size=500):
+    """Rewrite sessions stored in the other format into SESSION_STORAGE_FORMAT.
+    
+    Safe to re-run: only documents still in the old format are touched, and
+    reads handle both formats while the migration is in progress. Each
+    replace only applies to the revision that was read, so a session written
+    meanwhile is skipped and converted by the next run.
+    """
+    old_format_has_mask = SESSION_STORAGE_FORMAT != "bitmask"
+    query = {"completion_mask": {"$exists": old_format_has_mask}}
+    
+    migrated = 0
+    batch = []
+    async for doc in db.workout_sessions.find(query):
+        if doc.get("workout_day") not in WORKOUT_ROUTINE:
+            continue
+        batch.append(ReplaceOne(
+            {"_id": doc["_id"], "revision": doc.get("revision"), **query},
+            session_to_document(session_from_document(doc))
+        ))
+        if len(batch) >= batch_size:
+            result = await db.workout_sessions.bulk_write(batch, ordered=False)
+            migrated += result.modified_count
+            batch = []
+    if batch:
+        result = await db.workout_sessions.bulk_write(batch, ordered=False)
+        migrated += result.modified_count
+    
+    logger.info(f"Migrated {migrated} workout sessions to '{SESSION_STORAGE_FORMAT}' storage")
+    return migrated
+
+async def backfill_session_revisions(batch_size=500):
+    """Assign revisions to sessions written before delta sync existed.
+    
+    /sync pages by revision, so sessions without one would never reach a
+    client starting from cursor 0. Each batch reserves a block from the
+    revision counter, keeping backfilled revisions unique with live writes.
+    Safe to re-run: only sessions still lacking a revision are touched.
+    """
+    async def assign(docs):
+        last = await next_session_revision(len(docs))
+        now = datetime.utcnow()
+        await db.workout_sessions.bulk_write([
+            UpdateOne(
+                {"_id": doc["_id"], "revision": {"$exists": False}},
+                {"$set": {
+                    "revision": last - len(docs) + 1 + i,
+                    "updated_at": doc.get("updated_at") or doc.get("timestamp") or now
+                }}
+            )
+            for i, doc in enumerate(docs)
+        ], ordered=False)
+    
+    backfilled = 0
+    batch = []
+    async for doc in db.workout_sessions.find(
+        {"revision": {"$exists": False}}, {"updated_at": 1, "timestamp": 1}
+    ).sort("date", 1):
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            await assign(batch)
+            backfilled += len(batch)
+            batch = []
+    if batch:
+        await assign(batch)
+        backfilled += len(batch)
+    
+    if backfilled:
+        logger.info(f"Assigned revisions to {backfilled} workout sessions")
+    return backfilled
+
+def render_thumbnails(data):
+    """Render resized JPEG and WebP variants of an image (runs in an executor)"""
+    # Imported on first upload rather than at startup
+    from PIL import Image, ImageOps
+    
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        thumbnails = {}
+        for size in THUMBNAIL_SIZES:
+            resized = image.copy()
+            resized.thumbnail((size, size), Image.LANCZOS)
+            for extension, (image_format, _) in THUMBNAIL_FORMATS.items():
+                buffer = io.BytesIO()
+                resized.save(buffer, image_format, quality=80)
+                thumbnails[f"{size}.{extension}"] = buffer.getvalue()
+        return thumbnails
+
+def get_thumbnail_executor():
+    global thumbnail_executor
+    if thumbnail_executor is None:
+        if THUMBNAIL_EXECUTOR == "process":
+            from concurrent.futures import ProcessPoolExecutor as executor_class
+        else:
+            executor_class = ThreadPoolExecutor
+        thumbnail_executor = executor_class(max_workers=THUMBNAIL_WORKERS)
+    return thumbnail_executor
+
+def photo_bucket():
+    return AsyncIOMotorGridFSBucket(db, bucket_name="gym_photos")
+
+async def delete_photo_files(photo):
+    bucket = photo_bucket()
+    for file_id in [photo["file_id"], *photo.get("thumbnails", {}).values()]:
+        try:
+            await bucket.delete(ObjectId(file_id))
+        except NoFile:
+            pass
+
+def parse_range_header(range_header, length):
+    """Return (start, end) for a single 'bytes=' range, or None if unsatisfiable"""
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", range_header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    start, end = match.groups()
+    if start == "":
+        # Suffix range: the last N bytes
+        start, end = max(length - int(end), 0), length - 1
+    else:
+        start, end = int(start), min(int(end), length - 1) if end else length - 1
+    if start > end or start >= length:
+        return None
+    return start, end
+
+def habits_from_document(doc, date):
+    """Build DailyHabits from a stored bitfield document (or defaults when missing)"""
+    flags = doc.get("flags", 0) if doc else 0
+    photo_id = doc.get("gym_photo_id") if doc else None
+    return DailyHabits(
+        date=date,
+        **{name: bool(flags & bit) for name, bit in HABIT_FLAGS.items()},
+        eating_completed=flags & EATING_MASK == EATING_MASK,
+        completed_all=flags & ALL_HABITS_MASK == ALL_HABITS_MASK,
+        gym_photo=f"/api/photos/{photo_id}" if photo_id else None
+    )
+
+async def store_habit_photo(date, data_url):
+    """Decode a base64 data URL into GridFS and return the new file id"""
+    match = re.fullmatch(r"data:(image/[\w.+-]+);base64,(.+)", data_url, re.S)
+    if not match:
+        raise HTTPException(status_code=400, detail="gym_photo must be a base64 image data URL")
+    # Checked before decoding: base64 is 4 characters per 3 bytes
+    if len(match.group(2)) > 4 * -(-MAX_PHOTO_BYTES // 3):
+        raise HTTPException(status_code=413, detail="Photo is too large")
+    try:
+        data = base64.b64decode(match.group(2), validate=True)
+    except binascii.Error:
+        raise HTTPException(status_code=400, detail="gym_photo is not valid base64")
+    if len(data) > MAX_PHOTO_BYTES:
+        raise HTTPException(status_code=413, detail="Photo is too large")
+    file_id = await photo_bucket().upload_from_stream(
+        f"habits-{date}", data, metadata={"content_type": match.group(1), "date": date}
+    )
+    return str(file_id)
+
+async def write_habits(date, set_mask, clear_mask, gym_photo=None, replace_photo=False):
+    """Atomically set and clear habit bits for a day, creating the entry if needed"""
+    update = {"$set": {"updated_at": datetime.utcnow()}}
+    if set_mask or clear_mask:
+        update["$bit"] = {"flags": {"and": ~clear_mask, "or": set_mask}}
+    else:
+        update["$setOnInsert"] = {"flags": 0}
+    
+    new_photo_id = None
+    if replace_photo:
+        new_photo_id = await store_habit_photo(date, gym_photo) if gym_photo else None
+        update["$set"]["gym_photo_id"] = new_photo_id
+    
+    previous = await db.daily_habits.find_one_and_update(
+        {"date": date},
+        update,
+        upsert=True,
+        return_document=ReturnDocument.BEFORE
+    )
+    if replace_photo and previous and previous.get("gym_photo_id"):
+        await delete_photo_files({"file_id": previous["gym_photo_id"]})
+    
+    # Weekly progress joins habits with sessions
+    await derived_cache.bump("sessions")
+    
+    flags = previous.get("flags", 0) if previous else 0
+    flags = (flags & ~clear_mask) | set_mask
+    photo_id = new_photo_id if replace_photo else (previous or {}).get("gym_photo_id")
+    return habits_from_document({"flags": flags, "gym_photo_id": photo_id}, date)
+
+def monthly_target_workouts(year, month):
+    """Target workouts for a month: 4 per (partial) week"""
+    days_in_month = calendar.monthrange(year, month)[1]
+    weeks_in_month = (days_in_month // 7) + (1 if days_in_month % 7 > 0 else 0)
+    return weeks_in_month * 4
+
+def is_valid_date(value):
+    """Whether value is a real day in canonical YYYY-MM-DD form"""
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').strftime('%Y-%m-%d') == value
+    except ValueError:
+        return False
+
+def reward_labels(rule_ids):
+    return [REWARD_LABELS[rule_id] for rule_id in sorted(rule_ids, key=REWARD_ORDER.get) if rule_id in REWARD_LABELS]
+
+async def evaluate_rewards(date):
+    """Re-evaluate reward rules for the week and month containing `date`.
+    
+    Newly met rules are stored with their unlock time; rules that are no
+    longer met (e.g. a workout was unchecked) are removed. Counts are taken
+    again after writing: if a concurrent write moved them, this evaluation
+    may have overwritten a newer one's result, so it runs again.
+    """
+    day = datetime.strptime(date, '%Y-%m-%d').date()
+    week_start = day - timedelta(days=day.weekday())
+    month_start = day.replace(day=1)
+    month_end = month_start.replace(day=calendar.monthrange(day.year, day.month)[1])
+    periods = {
+        "week": (week_start.strftime('%Y-%m-%d'), week_start, week_start + timedelta(days=6), 4),
+        "month": (day.strftime('%Y-%m'), month_start, month_end, monthly_target_workouts(day.year, day.month)),
+    }
+    
+    async def count_periods():
+        return {
+            period: await count_completed_workouts(start, end)
+            for period, (_, start, end, _) in periods.items()
+        }
+    
+    counts = await count_periods()
+    changed = False
+    for _ in range(REWARD_EVALUATION_ATTEMPTS):
+        now = datetime.utcnow()
+        operations = []
+        for period, (period_key, start, end, target) in periods.items():
+            stats = {
+                "completed_workouts": counts[period],
+                "progress_percentage": (counts[period] / target) * 100 if target > 0 else 0
+            }
+            for rule in REWARD_RULES:
+                if rule["period"] != period:
+                    continue
+                event_filter = {"period": period, "period_key": period_key, "rule_id": rule["id"]}
+                if stats[rule["metric"]] >= rule["threshold"]:
+                    operations.append(UpdateOne(event_filter, {"$setOnInsert": {"unlocked_at": now}}, upsert=True))
+                else:
+                    operations.append(DeleteOne(event_filter))
+        
+        result = await db.reward_events.bulk_write(operations, ordered=False)
+        changed = changed or bool(result.upserted_count or result.deleted_count)
+        
+        previous, counts = counts, await count_periods()
+        if counts == previous:
+            break
+    else:
+        logger.warning(f"Rewards for {date} were still changing after {REWARD_EVALUATION_ATTEMPTS} evaluations")
+    
+    if changed:
+        # Weekly and monthly progress list the unlocked rewards
+        await derived_cache.bump("sessions")
+
+async def count_completed_workouts(start, end):
+    """Completed sessions dated between start and end inclusive, in both tiers"""
+    date_range = {"$gte": start.strftime('%Y-%m-%d'), "$lte": end.strftime('%Y-%m-%d')}
+    # Sessions edited during archival exist in both tiers until the next
+    # run, so completions are deduplicated on (date, workout_day) as the
+    # calendar aggregation does
+    hot = await db.workout_sessions.find(
+        {"date": date_range, **completed_session_filter()},
+        {"_id": 0, "date": 1, "workout_day": 1}
+    ).to_list(None)
+    completed_workouts = {(doc["date"], doc["workout_day"]) for doc in hot}
+    # Periods straddling the archive cutoff keep part of their history there
+    archived_months_in_period = {start.strftime('%Y-%m'), end.strftime('%Y-%m')} & await archived_months()
+    if archived_months_in_period:
+        archives = await db.workout_sessions_archive.find(
+            {"_id": {"$in": sorted(archived_months_in_period)}},
+            {"completed": 1}
+        ).to_list(None)
+        completed_workouts.update(
+            (entry["date"], entry["workout_day"])
+            for archive in archives for entry in archive["completed"]
+            if date_range["$gte"] <= entry["date"] <= date_range["$lte"]
+        )
+    return len(completed_workouts)
+
+exercise_sets_created = False
+
+async def create_exercise_sets_collection():
+    """Create the exercise_sets time-series collection once per process.
+    
+    Must run before the first insert or index, either of which would
+    implicitly create a plain collection instead.
+    """
+    global exercise_sets_created
+    if exercise_sets_created:
+        return
+    try:
+        await db.create_collection(
+            "exercise_sets",
+            timeseries={"timeField": "timestamp", "metaField": "meta", "granularity": "minutes"}
+        )
+    except CollectionInvalid:
+        pass  # already exists
+    exercise_sets_created = True
+
+async def update_personal_records(exercise_set):
+    """Fold one set into its exercise's personal records and return (record, improved names)"""
+    values = {
+        "weight": exercise_set.weight,
+        "reps": exercise_set.reps,
+        "duration_seconds": exercise_set.duration_seconds,
+        "volume": exercise_set.weight * exercise_set.reps
+        if exercise_set.weight is not None and exercise_set.reps is not None else None
+    }
+    maxima = {record: values[field] for record, field in SET_RECORD_FIELDS.items() if values[field]}
+    
+    if maxima:
+        previous = await db.personal_records.find_one_and_update(
+            {"_id": exercise_set.exercise_name},
+            {"$max": maxima},
+            upsert=True,
+            return_document=ReturnDocument.BEFORE
+        ) or {}
+    else:
+        previous = await db.personal_records.find_one({"_id": exercise_set.exercise_name}) or {}
+    new_records = [
+        record for record, value in maxima.items()
+        if previous.get(record) is None or value > previous[record]
+    ]
+    achieved_on = dict(previous.get("achieved_on", {}))
+    if new_records:
+        achieved_on.update({record: exercise_set.date for record in new_records})
+        # Guarded so a concurrent, higher record keeps its own date
+        for record in new_records:
+            await db.personal_records.update_one(
+                {"_id": exercise_set.exercise_name, record: maxima[record]},
+                {"$set": {f"achieved_on.{record}": exercise_set.date}}
+            )
+    
+    records = {
+        record: max(value for value in [previous.get(record), maxima.get(record)] if value is not None)
+        for record in SET_RECORD_FIELDS
+        if previous.get(record) is not None or record in maxima
+    }
+    personal_record = PersonalRecord(exercise_name=exercise_set.exercise_name, achieved_on=achieved_on, **records)
+    return personal_record, new_records
+
+def archive_cutoff():
+    """Sessions dated before this YYYY-MM-DD are eligible for archival"""
+    today = datetime.now().date()
+    cutoff = min(
+        today - timedelta(days=ARCHIVE_AFTER_DAYS),
+        today.replace(day=1),
+        today - timedelta(days=today.weekday())
+    )
+    return cutoff.strftime('%Y-%m-%d')
+
+def pack_sessions(docs):
+    return Binary(zlib.compress(bson.encode({"sessions": docs})))
+
+def unpack_sessions(archive):
+    return bson.decode(zlib.decompress(archive["sessions"]))["sessions"]
+
+async def archived_months():
+    """Months (YYYY-MM) that have an archive document"""
+    cache_version = derived_cache.version("archive")
+    months = derived_cache.get("archive", "months")
+    if months is None:
+        months = set(await db.workout_sessions_archive.distinct("_id"))
+        derived_cache.set("archive", "months", months, cache_version)
+    return months
+
+async def find_archived_sessions(date, workout_day=None):
+    """Archived session documents for a date (and optionally a workout day)"""
+    if date[:7] not in await archived_months():
+        return []
+    archive = await db.workout_sessions_archive.find_one({"_id": date[:7]})
+    if not archive:
+        return []
+    return [
+        doc for doc in unpack_sessions(archive)
+        if doc["date"] == date and (workout_day is None or doc["workout_day"] == workout_day)
+    ]
+
+async def write_archive_month(month, docs):
+    """Replace a month's archive document with `docs` (or drop it when empty)"""
+    if not docs:
+        await db.workout_sessions_archive.delete_one({"_id": month})
+        return
+    docs.sort(key=lambda doc: (doc["date"], doc["workout_day"]))
+    await db.workout_sessions_archive.replace_one(
+        {"_id": month},
+        {
+            "_id": month,
+            "count": len(docs),
+            # Uncompressed summary so streaks, calendars and rewards can read
+            # completions without inflating the sessions
+            "completed": [
+                {"date": doc["date"], "workout_day": doc["workout_day"]}
+                for doc in docs if session_from_document(doc).completed
+            ],
+            "sessions": pack_sessions(docs),
+            "archived_at": datetime.utcnow()
+        },
+        upsert=True
+    )
+
+async def restore_archived_session(date, workout_day):
+    """Move one archived session back to the hot collection so it can be edited"""
+    archive = await db.workout_sessions_archive.find_one({"_id": date[:7]})
+    if not archive:
+        return False
+    docs = unpack_sessions(archive)
+    restored = [doc for doc in docs if doc["date"] == date and doc["workout_day"] == workout_day]
+    if not restored:
+        return False
+    await db.workout_sessions.insert_one(restored[0])
+    await write_archive_month(date[:7], [doc for doc in docs if doc not in restored])
+    await derived_cache.bump("archive")
+    return True
+
+async def archive_old_sessions():
+    """Pack hot sessions older than archive_cutoff() into monthly archive documents.
+    
+    Safe to re-run after a crash: sessions are written to the archive before
+    they are deleted from the hot tier, and reads prefer the hot copy.
+    Sessions written while their month is being packed are left hot.
+    """
+    cutoff = archive_cutoff()
+    dates = await db.workout_sessions.distinct("date", {"date": {"$lt": cutoff}})
+    
+    archived = 0
+    for month in sorted({day[:7] for day in dates}):
+        hot_docs = await db.workout_sessions.find(
+            {"date": {"$gte": f"{month}-01", "$lte": f"{month}-31", "$lt": cutoff}}
+        ).to_list(None)
+        existing = await db.workout_sessions_archive.find_one({"_id": month})
+        merged = {(doc["date"], doc["workout_day"]): doc for doc in (unpack_sessions(existing) if existing else [])}
+        for doc in hot_docs:
+            merged[(doc["date"], doc["workout_day"])] = {k: v for k, v in doc.items() if k != "_id"}
+        
+        await write_archive_month(month, list(merged.values()))
+        if hot_docs:
+            # Only delete the revision that was packed: a session edited since
+            # stays hot, shadows its stale archived copy and is re-packed next run
+            result = await db.workout_sessions.bulk_write([
+                DeleteOne({"_id": doc["_id"], "revision": doc.get("revision")})
+                for doc in hot_docs
+            ], ordered=False)
+            archived += result.deleted_count
+        await derived_cache.bump(f"calendar:{month}")
+    
+    if archived:
+        await derived_cache.bump("archive", "sessions")
+    logger.info(f"Archived {archived} workout sessions older than {cutoff}")
+    return archived
+
+def archived_completions_stage(months=None):
+    """$unionWith stage adding archived completed sessions as {date, workout_day} rows"""
+    pipeline = [
+        {"$unwind": "$completed"},
+        {"$replaceRoot": {"newRoot": "$completed"}}
+    ]
+    if months is not None:
+        pipeline.insert(0, {"$match": {"_id": {"$in": sorted(months)}}})
+    return {"$unionWith": {"coll": "workout_sessions_archive", "pipeline": pipeline}}
+
+async def next_session_revision(count=1):
+    """Reserve `count` session revisions and return the highest"""
+    counter = await db.counters.find_one_and_update(
+        {"_id": "session_revision"},
+        {"$inc": {"value": count}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return counter["value"]
+
+async def apply_exercise_update(date, workout_day, exercise_name, completed, timestamp=None):
+    """Set one exercise's completion and return the updated WorkoutSession.
+    
+    Callers are responsible for invalidating derived caches afterwards.
+    """
+    revision = await next_session_revision()
+    now = datetime.utcnow()
+    completed_at = (timestamp or now) if completed else None
+    
+    # Compact sessions are updated in place with a single atomic round trip
+    if SESSION_STORAGE_FORMAT == "bitmask" and workout_day in WORKOUT_ROUTINE:
+        names = routine_exercise_names(workout_day)
+        if exercise_name in names:
+            index = names.index(exercise_name)
+            bit = 1 << index
+            previous_doc = await db.workout_sessions.find_one_and_update(
+                {"date": date, "workout_day": workout_day, "completion_mask": {"$exists": True}},
+                {
+                    "$bit": {"completion_mask": {"or": bit} if completed else {"and": ~bit}},
+                    "$set": {
+                        f"completion_times.{index}": completed_at,
+                        "updated_at": now,
+                        "revision": revision
+                    }
+                },
+                return_document=ReturnDocument.BEFORE
+            )
+            if previous_doc:
+                # Apply the same change locally to learn whether completion flipped
+                full_mask = full_completion_mask(workout_day)
+                previous_mask = previous_doc["completion_mask"]
+                times = list(previous_doc.get("completion_times") or [])
+                times += [None] * (index + 1 - len(times))
+                times[index] = completed_at
+                workout_session = session_from_document({
+                    **previous_doc,
+                    "completion_mask": previous_mask | bit if completed else previous_mask & ~bit,
+                    "completion_times": times,
+                    "updated_at": now,
+                    "revision": revision
+                })
+                if workout_session.completed != (previous_mask & full_mask == full_mask):
+                    await evaluate_rewards(date)
+                return workout_session
+    
+    session = await db.workout_sessions.find_one({
+        "date": date,
+        "workout_day": workout_day
+    })
+    
+    if not session and date[:7] in await archived_months():
+        # Archived sessions are moved back to the hot tier when edited
+        if await restore_archived_session(date, workout_day):
+            session = await db.workout_sessions.find_one({"date": date, "workout_day": workout_day})
+    
+    if not session:
+        raise HTTPException(status_code=404, detail="Workout session not found")
+    
+    workout_session = session_from_document(session)
+    was_completed = workout_session.completed
+    
+    # Update exercise completion
+    updated = False
+    for exercise in workout_session.exercises:
+        if exercise.exercise_name == exercise_name:
+            exercise.completed = completed
+            exercise.timestamp = completed_at
+            updated = True
+            break
+    
+    if not updated:
+        raise HTTPException(status_code=404, detail="Exercise not found")
+    
+    # Recalculate completion stats
+    workout_session.completion_percentage = calculate_completion_percentage(workout_session.exercises)
+    workout_session.completed = is_workout_complete(workout_session.exercises)
+    workout_session.updated_at = now
+    workout_session.revision = revision
+    
+    # Legacy documents are rewritten in the configured format on write
+    await db.workout_sessions.replace_one(
+        {"date": date, "workout_day": workout_day}, 
+        session_to_document(workout_session)
+    )
+    if workout_session.completed != was_completed:
+        await evaluate_rewards(date)
+    
+    return workout_session
+
+# Cross-process cache coherence
+class VersionedCache:
+    """Process-local cache of derived results, grouped into namespaces.
+    
+    Each namespace has a version counter in the cache_versions collection.
+    Writers bump the counter through bump(), which also clears the namespace
+    locally; every worker polls the counters via sync() and drops namespaces
+    whose version moved, so a write handled by any worker invalidates all
+    workers within CACHE_SYNC_INTERVAL seconds.
+    
+    Both run in causally consistent sessions and remember the latest operation
+    time they saw, so analytics reads can wait for secondaries to catch up
+    with every invalidation before recomputing (see causal_analytics_session).
+    """
+    def __init__(self):
+        self.entries = {}
+        self.versions = {}
+        self.cluster_time = None
+        self.operation_time = None
+    
+    def observe(self, session):
+        if session.operation_time is not None and (
+            self.operation_time is None or session.operation_time > self.operation_time
+        ):
+            self.operation_time = session.operation_time
+            self.cluster_time = session.cluster_time
+    
+    def version(self, namespace):
+        return self.versions.get(namespace, 0)
+    
+    def get(self, namespace, key):
+        value = self.entries.get(namespace, {}).get(key)
+        metrics["cache"]["hits" if value is not None else "misses"] += 1
+        return value
+    
+    def set(self, namespace, key, value, version):
+        """Store a value computed while the namespace was at `version`"""
+        # Drop results that raced with an invalidation while being computed
+        if self.version(namespace) == version:
+            self.entries.setdefault(namespace, {})[key] = value
+    
+    def invalidate(self, namespace, version):
+        self.entries.pop(namespace, None)
+        self.versions[namespace] = version
+        metrics["cache"]["invalidations"] += 1
+    
+    async def bump(self, *namespaces):
+        async with await client.start_session(causal_consistency=True) as session:
+            for namespace in namespaces:
+                doc = await db.cache_versions.find_one_and_update(
+                    {"_id": namespace},
+                    {"$inc": {"version": 1}},
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER,
+                    session=session
+                )
+                self.invalidate(namespace, doc["version"])
+            self.observe(session)
+    
+    async def sync(self):
+        async with await client.start_session(causal_consistency=True) as session:
+            async for doc in db.cache_versions.find({}, session=session):
+                if self.versions.get(doc["_id"]) != doc["version"]:
+                    self.invalidate(doc["_id"], doc["version"])
+            self.observe(session)
+        metrics["cache"]["syncs"] += 1
+
+derived_cache = VersionedCache()
+
+@contextlib.asynccontextmanager
+async def causal_analytics_session():
+    """Session for analytics reads that is causally after every invalidation
+    this process has seen, so results cached from a secondary are never older
+    than the cache version they are stored under"""
+    async with await client.start_session(causal_consistency=True) as session:
+        if derived_cache.operation_time is not None:
+            session.advance_cluster_time(derived_cache.cluster_time)
+            session.advance_operation_time(derived_cache.operation_time)
+        yield session
+
+async def analytics_read(query):
+    """Run `await query(database, session)` as a causal analytics read.
+    
+    The read may wait for a secondary to replicate the invalidations this
+    worker has seen; if it does not finish within ANALYTICS_MAX_TIME_MS it
+    is re-run on the primary, which is never behind.
+    """
+    try:
+        with pymongo.timeout(ANALYTICS_MAX_TIME_MS / 1000):
+            async with causal_analytics_session() as session:
+                return await query(analytics_db, session)
+    except PyMongoError as e:
+        if not e.timeout:
+            raise
+        metrics["analytics_primary_fallbacks"] += 1
+        logger.warning(f"Analytics read timed out, retrying on the primary: {e}")
+        return await query(db, None)
+
+async def analytics_aggregate(collection_name, pipeline, length=None):
+    return await analytics_read(
+        lambda database, session: database[collection_name].aggregate(pipeline, session=session).to_list(length)
+    )
+
+async def progress_revision(*namespaces):
+    """Current progress revision, read from the primary: the sessions cache
+    version plus those of `namespaces` (e.g. the calendar months a route
+    serves from their own cache).
+    
+    Also catches this worker's cache up with them, so a response tagged with
+    the revision is never built from older cached results. Versions only
+    grow, so their sum changes whenever any of them does.
+    """
+    namespaces = ["sessions", *namespaces]
+    async with await client.start_session(causal_consistency=True) as session:
+        versions = {
+            doc["_id"]: doc["version"]
+            async for doc in db.cache_versions.find({"_id": {"$in": namespaces}}, {"version": 1}, session=session)
+        }
+        changed = [namespace for namespace in namespaces if derived_cache.version(namespace) != versions.get(namespace, 0)]
+        # Like sync(): analytics reads only need to wait for this read when it
+        # caught up an invalidation, not on every request
+        if changed:
+            derived_cache.observe(session)
+    for namespace in changed:
+        derived_cache.invalidate(namespace, versions.get(namespace, 0))
+    return sum(versions.values())
+
+def etag_matches(request, etag):
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]
+
+def not_modified(etag):
+    return Response(status_code=304, headers={"ETag": etag})
+
+async def progress_etag(*namespaces):
+    # Progress also depends on today's date (week/month rollover, streaks)
+    return f'"p{await progress_revision(*namespaces)}-{datetime.now().date()}"'
+
+async def invalidate_session_caches(date):
+    """Invalidate results derived from sessions after a write to `date`"""
+    await derived_cache.bump("sessions", f"calendar:{date[:7]}")
+
+async def sync_cache_versions():
+    while True:
+        try:
+            await derived_cache.sync()
+        except Exception as e:
+            metrics["cache"]["sync_errors"] += 1
+            logger.warning(f"Cache version sync failed: {e}")
+        await asyncio.sleep(CACHE_SYNC_INTERVAL)
+
+# Request coalescing
+def is_coalesced_path(path):
+    return any(path == route.rstrip("/") or path.startswith(route.rstrip("/") + "/") for route in COALESCED_ROUTES)
+
+def copy_message(message):
+    """Copy of an ASGI message whose headers outer middleware can modify in place
+    without changing the response replayed to other requests"""
+    if "headers" in message:
+        return {**message, "headers": list(message["headers"])}
+    return message
+
+class RequestCoalescingMiddleware:
+    """Single-flight layer for idempotent GET routes.
+    
+    Requests are keyed on path, query string and the caller's credentials. While
+    a leader request is being served, identical requests wait for it and replay
+    its serialized response instead of running the route again. If the leader
+    fails or is cancelled, waiting requests are served independently.
+    """
+    def __init__(self, app):
+        self.app = app
+        self.in_flight = {}
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET" or not is_coalesced_path(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+        
+        headers = dict(scope["headers"])
+        key = (
+            scope["path"], scope["query_string"],
+            headers.get(b"authorization"), headers.get(b"cookie"), headers.get(b"x-profile-token"),
+            headers.get(b"if-none-match")
+        )
+        stats = metrics["coalescing"]
+        stats["requests"] += 1
+        
+        pending = self.in_flight.get(key)
+        if pending is not None:
+            messages = await asyncio.shield(pending)
+            if messages is not None:
+                stats["coalesced"] += 1
+                for message in messages:
+                    await send(copy_message(message))
+                return
+            await self.app(scope, receive, send)
+            return
+        
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[key] = future
+        stats["leaders"] += 1
+        stats["in_flight"] += 1
+        messages = []
+        completed = False
+        
+        async def capture(message):
+            nonlocal completed
+            messages.append(copy_message(message))
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                completed = True
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, capture)
+        finally:
+            del self.in_flight[key]
+            stats["in_flight"] -= 1
+            future.set_result(messages if completed else None)
+
+# Request profiling
+def save_profile(profile, path):
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    profile.dump_stats(str(path))
+    # File names start with their UTC timestamp, so they sort oldest first
+    profiles = sorted(PROFILE_DIR.glob("*.prof"))
+    for old in profiles[:max(len(profiles) - PROFILE_MAX_FILES, 0)]:
+        old.unlink(missing_ok=True)
+
+class ProfilingMiddleware:
+    """Tag each request with its route and optionally capture a CPU profile.
+    
+    Profiled requests are written to PROFILE_DIR as cProfile .prof files and the
+    file name is returned in the X-Profile-File response header. Only the
+    newest PROFILE_MAX_FILES files are kept. The profiler
+    sees everything that runs on the event loop while the request is in flight,
+    so concurrent requests can show up in the profile; only one request is
+    profiled at a time.
+    """
+    def __init__(self, app):
+        self.app = app
+        self.profiling = False
+    
+    def should_profile(self, scope):
+        if self.profiling:
+            return False
+        token = dict(scope["headers"]).get(b"x-profile-token")
+        if PROFILE_TOKEN and token is not None and hmac.compare_digest(token, PROFILE_TOKEN.encode()):
+            return True
+        return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        route_token = current_route.set(f"{scope['method']} {scope['path']}")
+        try:
+            if not self.should_profile(scope):
+                await self.app(scope, receive, send)
+                return
+            
+            slug = re.sub(r"[^A-Za-z0-9]+", "-", scope["path"]).strip("-")
+            profile_path = PROFILE_DIR / f"{datetime.utcnow():%Y%m%dT%H%M%S%f}-{scope['method']}-{slug}.prof"
+            
+            async def send_with_profile_header(message):
+                if message["type"] == "http.response.start":
+                    message["headers"] = list(message.get("headers", [])) + [(b"x-profile-file", profile_path.name.encode())]
+                await send(message)
+            
+            import cProfile
+            
+            profile = cProfile.Profile()
+            self.profiling = True
+            profile.enable()
+            try:
+                await self.app(scope, receive, send_with_profile_header)
+            finally:
+                profile.disable()
+                self.profiling = False
+                await asyncio.to_thread(save_profile, profile, profile_path)
+                metrics["profiles"] += 1
+        finally:
+            current_route.reset(route_token)
+
+# Background scheduler
+def daily_at(hour, minute):
+    def next_run(now):
+        run_at = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        return run_at if run_at > now else run_at + timedelta(days=1)
+    return next_run
+
+def weekly_at(weekday, hour, minute):
+    def next_run(now):
+        run_at = daily_at(hour, minute)(now)
+        return run_at + timedelta(days=(weekday - run_at.weekday()) % 7)
+    return next_run
+
+class Scheduler:
+    """Run coroutine jobs at wall-clock boundaries inside each worker.
+    
+    Every run is delayed by up to SCHEDULER_JITTER_SECONDS so workers and
+    replicas do not hit Mongo at the same instant. Leader-only jobs insert a
+    claim keyed on the job name and scheduled time; the worker whose insert
+    wins runs the job and the others skip that occurrence.
+    """
+    def __init__(self):
+        self.jobs = []
+        self.tasks = []
+    
+    def add_job(self, name, next_run, job, leader_only=True):
+        self.jobs.append((name, next_run, job, leader_only))
+        metrics["scheduler"][name] = {
+            "runs": 0, "failures": 0, "skipped": 0,
+            "last_run_at": None, "last_duration_ms": None, "max_duration_ms": 0.0, "total_duration_ms": 0.0
+        }
+    
+    def start(self):
+        self.tasks = [asyncio.create_task(self.run_forever(*job)) for job in self.jobs]
+    
+    def stop(self):
+        for task in self.tasks:
+            task.cancel()
+    
+    async def claim(self, name, scheduled_for):
+        try:
+            await db.scheduler_claims.insert_one({
+                "_id": f"{name}:{scheduled_for.isoformat()}",
+                "worker": WORKER_ID,
+                "claimed_at": datetime.utcnow()
+            })
+            return True
+        except DuplicateKeyError:
+            return False
+    
+    async def run_forever(self, name, next_run, job, leader_only):
+        stats = metrics["scheduler"][name]
+        while True:
+            scheduled_for = next_run(datetime.now())
+            delay = (scheduled_for - datetime.now()).total_seconds() + random.uniform(0, SCHEDULER_JITTER_SECONDS)
+            await asyncio.sleep(max(delay, 0))
+            
+            try:
+                if leader_only and not await self.claim(name, scheduled_for):
+                    stats["skipped"] += 1
+                    continue
+                
+                started = time.perf_counter()
+                await job()
+                duration_ms = (time.perf_counter() - started) * 1000
+                stats["runs"] += 1
+                stats["last_run_at"] = datetime.utcnow().isoformat()
+                stats["last_duration_ms"] = round(duration_ms, 2)
+                stats["max_duration_ms"] = round(max(stats["max_duration_ms"], duration_ms), 2)
+                stats["total_duration_ms"] = round(stats["total_duration_ms"] + duration_ms, 2)
+                logger.info(f"Scheduled job {name} finished in {duration_ms:.0f} ms")
+            except Exception as e:
+                stats["failures"] += 1
+                logger.exception(f"Scheduled job {name} failed: {e}")
+
+async def precreate_next_day_sessions():
+    """Create tomorrow's sessions for every routine day ahead of time"""
+    day = (datetime.now().date() + timedelta(days=1)).strftime('%Y-%m-%d')
+    existing = await db.workout_sessions.distinct("workout_day", {"date": day})
+    missing = [workout_day for workout_day in WORKOUT_ROUTINE if workout_day not in existing]
+    if not missing:
+        return
+    # One counter round trip reserves the revisions of every new session
+    last = await next_session_revision(len(missing))
+    operations = []
+    for i, workout_day in enumerate(missing):
+        routine = WORKOUT_ROUTINE[workout_day]
+        session = WorkoutSession(
+            date=day,
+            workout_day=workout_day,
+            workout_name=routine["name"],
+            exercises=[ExerciseCompletion(exercise_name=ex["name"]) for ex in routine["exercises"]],
+            revision=last - len(missing) + 1 + i
+        )
+        operations.append(UpdateOne(
+            {"date": day, "workout_day": workout_day},
+            {"$setOnInsert": session_to_document(session)},
+            upsert=True
+        ))
+    await db.workout_sessions.bulk_write(operations, ordered=False)
+    await invalidate_session_caches(day)
+
+async def roll_over_week():
+    """Settle last week's rewards and seed the new week and month"""
+    today = datetime.now().date()
+    await evaluate_rewards((today - timedelta(days=1)).strftime('%Y-%m-%d'))
+    await evaluate_rewards(today.strftime('%Y-%m-%d'))
+
+async def warm_caches():
+    """Precompute progress and routine payloads in this worker's cache"""
+    await compute_weekly_progress()
+    await compute_monthly_progress()
+    await compute_calendar_heatmap(None)
+    await get_all_workouts()
+    for day in WORKOUT_ROUTINE:
+        await get_workout(day)
+
+scheduler = Scheduler()
+warm_hour, warm_minute = (int(part) for part in WARM_CACHES_AT.split(":"))
+scheduler.add_job("precreate_next_day_sessions", daily_at(0, 10), precreate_next_day_sessions)
+scheduler.add_job("roll_over_week", weekly_at(0, 0, 15), roll_over_week)
+scheduler.add_job("archive_old_sessions", daily_at(1, 0), archive_old_sessions)
+# Caches are per process, so every worker warms its own
+scheduler.add_job("warm_caches", daily_at(warm_hour, warm_minute), warm_caches, leader_only=False)
+
 # Routes
 @api_router.get("/")
 async def root():
@@ -321,8 +1786,15 @@ async def create_workout_session(session_data: WorkoutSessionCreate):
             "workout_day": session_data.workout_day
         })
         
+        if not existing and session_data.date[:7] in await archived_months():
+            if await restore_archived_session(session_data.date, session_data.workout_day):
+                existing = await db.workout_sessions.find_one({
+                    "date": session_data.date,
+                    "workout_day": session_data.workout_day
+                })
+        
         if existing:
-            return WorkoutSession(**existing)
+            return session_from_document(existing)
         
         # Get workout routine
         if session_data.workout_day not in WORKOUT_ROUTINE:
@@ -343,10 +1815,12 @@ async def create_workout_session(session_data: WorkoutSessionCreate):
             workout_name=routine["name"],
             exercises=exercises,
             completed=False,
-            completion_percentage=0.0
+            completion_percentage=0.0,
+            revision=await next_session_revision()
         )
         
-        await db.workout_sessions.insert_one(session.dict())
+        await db.workout_sessions.insert_one(session_to_document(session))
+        await invalidate_session_caches(session.date)
         return session
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -355,214 +1829,822 @@ async def create_workout_session(session_data: WorkoutSessionCreate):
 async def update_exercise_completion(date: str, workout_day: int, exercise_update: ExerciseUpdate):
     """Update completion status of a specific exercise"""
     try:
-        session = await db.workout_sessions.find_one({
-            "date": date,
-            "workout_day": workout_day
-        })
+        return await apply_exercise_update(
+            date, workout_day, exercise_update.exercise_name, exercise_update.completed
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        # The session may have been written before a later step failed
+        await invalidate_session_caches(date)
+
+@api_router.get("/workout-session/{date}/{workout_day}", response_model=WorkoutSession)
+async def get_workout_session(
+    date: str, workout_day: int, request: Request, response: Response,
+    fields: Optional[str] = Query(None, description="Comma-separated WorkoutSession fields to return")
+):
+    """Get workout session for a specific date and workout day"""
+    try:
+        selected = parse_fields(fields, WorkoutSession)
+        if request.headers.get("if-none-match"):
+            # Covered by the (date, workout_day, revision) index: no document is loaded
+            current = await db.workout_sessions.find_one(
+                {"date": date, "workout_day": workout_day},
+                {"_id": 0, "revision": 1}
+            )
+            if current and etag_matches(request, f'"s{current.get("revision", 0)}"'):
+                return not_modified(f'"s{current.get("revision", 0)}"')
+        
+        session = await db.workout_sessions.find_one(
+            {"date": date, "workout_day": workout_day},
+            session_projection(selected) if selected else None
+        )
         
         if not session:
-            raise HTTPException(status_code=404, detail="Workout session not found")
+            archived = await find_archived_sessions(date, workout_day)
+            if archived:
+                session = archived[0]
         
-        # Update exercise completion
-        updated = False
-        for exercise in session["exercises"]:
-            if exercise["exercise_name"] == exercise_update.exercise_name:
-                exercise["completed"] = exercise_update.completed
-                exercise["timestamp"] = datetime.utcnow() if exercise_update.completed else None
-                updated = True
-                break
+        if not session:
+            # Create default session
+            create_data = WorkoutSessionCreate(date=date, workout_day=workout_day)
+            workout_session = await create_workout_session(create_data)
+        elif selected:
+            return sparse_response(sparse_session(session, selected), {"ETag": f'"s{session.get("revision", 0)}"'})
+        else:
+            workout_session = session_from_document(session)
         
-        if not updated:
-            raise HTTPException(status_code=404, detail="Exercise not found")
+        etag = f'"s{workout_session.revision}"'
+        if selected:
+            return sparse_response(workout_session.dict(include=selected), {"ETag": etag})
+        response.headers["ETag"] = etag
+        return workout_session
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.post("/workout-session/{date}/{workout_day}/photo", response_model=WorkoutSession)
+async def upload_session_photo(date: str, workout_day: int, photo: UploadFile = File(...)):
+    """Upload a gym photo for a workout session"""
+    try:
+        if not (photo.content_type or "").startswith("image/"):
+            raise HTTPException(status_code=400, detail="Photo must be an image")
         
-        # Recalculate completion stats
-        exercises = [ExerciseCompletion(**ex) for ex in session["exercises"]]
-        session["completion_percentage"] = calculate_completion_percentage(exercises)
-        session["completed"] = is_workout_complete(exercises)
+        session = await db.workout_sessions.find_one({"date": date, "workout_day": workout_day}, {"photo": 1})
+        if not session:
+            raise HTTPException(status_code=404, detail="Workout session not found")
         
-        await db.workout_sessions.replace_one(
-            {"date": date, "workout_day": workout_day}, 
-            session
+        # Stream the original into GridFS, keeping a copy for thumbnailing
+        bucket = photo_bucket()
+        grid_in = bucket.open_upload_stream(
+            photo.filename or "photo",
+            chunk_size_bytes=PHOTO_CHUNK_SIZE,
+            metadata={"content_type": photo.content_type, "date": date, "workout_day": workout_day}
         )
+        data = bytearray()
+        while chunk := await photo.read(PHOTO_CHUNK_SIZE):
+            data.extend(chunk)
+            if len(data) > MAX_PHOTO_BYTES:
+                await grid_in.abort()
+                raise HTTPException(status_code=413, detail="Photo is too large")
+            await grid_in.write(chunk)
+        await grid_in.close()
+        file_id = grid_in._id
         
-        return WorkoutSession(**session)
+        # From here on the uploaded files are deleted again if anything fails,
+        # so a rejected or failed upload leaves nothing behind in GridFS
+        thumbnails = {}
+        try:
+            from PIL import Image
+            
+            try:
+                loop = asyncio.get_running_loop()
+                rendered = await loop.run_in_executor(get_thumbnail_executor(), render_thumbnails, bytes(data))
+            # OSError includes PIL's UnidentifiedImageError; a decompression
+            # bomb is a small file with huge dimensions
+            except (OSError, Image.DecompressionBombError):
+                raise HTTPException(status_code=400, detail="Photo could not be decoded")
+            
+            for name, thumbnail in rendered.items():
+                content_type = THUMBNAIL_FORMATS[name.split(".")[1]][1]
+                thumbnail_id = await bucket.upload_from_stream(
+                    f"{file_id}-{name}", thumbnail, metadata={"content_type": content_type}
+                )
+                thumbnails[name] = str(thumbnail_id)
+            
+            session_photo = SessionPhoto(
+                file_id=str(file_id),
+                content_type=photo.content_type,
+                size=len(data),
+                thumbnails=thumbnails
+            )
+            updated_doc = await db.workout_sessions.find_one_and_update(
+                {"date": date, "workout_day": workout_day},
+                {"$set": {
+                    "photo": session_photo.dict(),
+                    "updated_at": datetime.utcnow(),
+                    "revision": await next_session_revision()
+                }},
+                return_document=ReturnDocument.AFTER
+            )
+            if not updated_doc:
+                # Deleted while the photo was uploading
+                raise HTTPException(status_code=404, detail="Workout session not found")
+        except Exception:
+            await delete_photo_files({"file_id": file_id, "thumbnails": thumbnails})
+            raise
+        
+        if session.get("photo"):
+            await delete_photo_files(session["photo"])
+        
+        return session_from_document(updated_doc)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@api_router.get("/workout-session/{date}/{workout_day}", response_model=WorkoutSession)
-async def get_workout_session(date: str, workout_day: int):
-    """Get workout session for a specific date and workout day"""
+@api_router.get("/photos/{file_id}")
+async def get_photo(file_id: str, request: Request):
+    """Serve a stored gym photo or thumbnail, with Range support"""
     try:
-        session = await db.workout_sessions.find_one({
-            "date": date,
-            "workout_day": workout_day
-        })
+        try:
+            grid_out = await photo_bucket().open_download_stream(ObjectId(file_id))
+        except (InvalidId, NoFile):
+            raise HTTPException(status_code=404, detail="Photo not found")
         
-        if not session:
-            # Create default session
-            create_data = WorkoutSessionCreate(date=date, workout_day=workout_day)
-            return await create_workout_session(create_data)
+        # File ids are never reused, so stored images are immutable
+        headers = {
+            "ETag": f'"{file_id}"',
+            "Cache-Control": "public, max-age=31536000, immutable",
+            "Accept-Ranges": "bytes"
+        }
+        if request.headers.get("if-none-match") == headers["ETag"]:
+            return Response(status_code=304, headers=headers)
+        
+        length = grid_out.length
+        start, end = 0, length - 1
+        status_code = 200
+        range_header = request.headers.get("range")
+        if range_header and length:
+            byte_range = parse_range_header(range_header, length)
+            if byte_range is None:
+                return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{length}"})
+            start, end = byte_range
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{length}"
+        headers["Content-Length"] = str(end - start + 1 if length else 0)
         
-        return WorkoutSession(**session)
+        async def stream_file():
+            grid_out.seek(start)
+            remaining = end - start + 1 if length else 0
+            while remaining > 0:
+                chunk = await grid_out.read(min(PHOTO_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+        
+        media_type = (grid_out.metadata or {}).get("content_type", "application/octet-stream")
+        return StreamingResponse(stream_file(), status_code=status_code, media_type=media_type, headers=headers)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.get("/workout-sessions/{date}")
-async def get_all_sessions_for_date(date: str):
+async def get_all_sessions_for_date(
+    date: str,
+    fields: Optional[str] = Query(None, description="Comma-separated WorkoutSession fields to return")
+):
     """Get all workout sessions for a specific date"""
     try:
-        sessions = await db.workout_sessions.find({"date": date}).to_list(10)
-        return [WorkoutSession(**session) for session in sessions]
+        selected = parse_fields(fields, WorkoutSession)
+        sessions = await db.workout_sessions.find(
+            {"date": date},
+            session_projection(selected) if selected else None
+        ).to_list(10)
+        hot_days = {session["workout_day"] for session in sessions}
+        sessions += [
+            session for session in await find_archived_sessions(date)
+            if session["workout_day"] not in hot_days
+        ]
+        if selected:
+            return sparse_response([sparse_session(session, selected) for session in sessions])
+        return [session_from_document(session) for session in sessions]
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@api_router.get("/progress/weekly")
-async def get_weekly_progress():
-    """Get weekly gym progress"""
+@api_router.post("/sync", response_model=SyncResponse)
+async def sync_sessions(sync_request: SyncRequest):
+    """Replay queued exercise updates and return sessions changed since the client's cursor"""
     try:
-        # Get current week's sessions
-        today = datetime.now().date()
-        week_start = today - timedelta(days=today.weekday())
-        week_dates = [(week_start + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(7)]
-        
-        sessions = await db.workout_sessions.find({
-            "date": {"$in": week_dates},
-            "completed": True
-        }).to_list(100)
-        
-        completed_workouts = len(sessions)
-        workout_days_completed = list(set(session["workout_day"] for session in sessions))
-        
-        progress_percentage = (completed_workouts / 4) * 100  # 4 workouts target per week
-        progress_percentage = min(progress_percentage, 100)  # Cap at 100%
-        
-        # Determine rewards based on progress
-        rewards = []
-        if completed_workouts >= 1:
-            rewards.append("🌟 First Workout!")
-        if completed_workouts >= 2:
-            rewards.append("🔥 Getting Strong!")
-        if completed_workouts >= 3:
-            rewards.append("💎 Almost There!")
-        if completed_workouts >= 4:
-            rewards.append("👑 Workout Queen!")
-        
-        return WeeklyProgress(
-            week_start=week_start.strftime('%Y-%m-%d'),
-            completed_workouts=completed_workouts,
-            total_target=4,
-            progress_percentage=progress_percentage,
-            workout_days_completed=workout_days_completed,
-            rewards_unlocked=rewards
+        applied = 0
+        rejected = []
+        written_dates = set()
+        try:
+            for index, update in enumerate(sync_request.updates):
+                if update.workout_day not in WORKOUT_ROUTINE:
+                    rejected.append(SyncRejection(index=index, detail="Invalid workout day"))
+                    continue
+                if not is_valid_date(update.date):
+                    rejected.append(SyncRejection(index=index, detail="Invalid date, expected YYYY-MM-DD"))
+                    continue
+                # Added first: a failure after the write must still invalidate
+                written_dates.add(update.date)
+                try:
+                    existing = await db.workout_sessions.find_one(
+                        {"date": update.date, "workout_day": update.workout_day},
+                        {"_id": 1}
+                    )
+                    if not existing:
+                        await create_workout_session(WorkoutSessionCreate(date=update.date, workout_day=update.workout_day))
+                    await apply_exercise_update(
+                        update.date, update.workout_day, update.exercise_name, update.completed, update.timestamp
+                    )
+                    applied += 1
+                except HTTPException as e:
+                    rejected.append(SyncRejection(index=index, detail=str(e.detail)))
+        finally:
+            for written_date in written_dates:
+                await invalidate_session_caches(written_date)
+        
+        docs = await db.workout_sessions.find(
+            {"revision": {"$gt": sync_request.cursor}}
+        ).sort("revision", 1).limit(SYNC_PAGE_SIZE).to_list(SYNC_PAGE_SIZE)
+        sessions = [session_from_document(doc) for doc in docs]
+        
+        cursor = sync_request.cursor
+        settled_before = datetime.utcnow() - timedelta(seconds=SYNC_SETTLE_SECONDS)
+        for session in sessions:
+            if session.updated_at > settled_before:
+                break
+            cursor = session.revision
+        
+        return SyncResponse(
+            cursor=cursor,
+            sessions=sessions,
+            has_more=len(docs) == SYNC_PAGE_SIZE,
+            applied=applied,
+            rejected=rejected
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@api_router.get("/progress/monthly")
-async def get_monthly_progress():
-    """Get monthly gym progress"""
+@api_router.post("/workout-session/{date}/{workout_day}/sets", response_model=ExerciseSetResult)
+async def log_exercise_set(date: str, workout_day: int, set_data: ExerciseSetCreate):
+    """Log one set of an exercise and update its personal records"""
     try:
-        today = datetime.now().date()
-        month_start = today.replace(day=1)
-        
-        # Get days in current month
-        days_in_month = calendar.monthrange(today.year, today.month)[1]
-        
-        # Calculate target workouts for month (4 per week)
-        weeks_in_month = (days_in_month // 7) + (1 if days_in_month % 7 > 0 else 0)
-        target_workouts = weeks_in_month * 4
-        
-        # Get completed workouts this month
-        sessions = await db.workout_sessions.find({
-            "date": {"$regex": f"^{today.strftime('%Y-%m')}"},
-            "completed": True
-        }).to_list(1000)
-        
-        completed_workouts = len(sessions)
-        progress_percentage = (completed_workouts / target_workouts) * 100 if target_workouts > 0 else 0
-        
-        # Calculate streak
-        streak_info = await get_streak_info()
-        
-        # Monthly rewards
-        rewards = []
-        if completed_workouts >= 2:
-            rewards.append("🎯 Month Started!")
-        if completed_workouts >= 6:
-            rewards.append("💪 Strong Month!")
-        if completed_workouts >= 10:
-            rewards.append("🔥 Excellent Month!")
-        if completed_workouts >= 14:
-            rewards.append("👑 Amazing Month!")
-        if progress_percentage >= 90:
-            rewards.append("🏆 Perfect Month!")
-        
-        return MonthlyProgress(
-            month=today.strftime('%Y-%m'),
-            total_workouts=target_workouts,
-            completed_workouts=completed_workouts,
-            progress_percentage=progress_percentage,
-            current_streak=streak_info.current_streak,
-            longest_streak=streak_info.longest_streak,
-            rewards_unlocked=rewards
+        if not is_valid_date(date):
+            raise HTTPException(status_code=400, detail="Invalid date, expected YYYY-MM-DD")
+        if workout_day not in WORKOUT_ROUTINE:
+            raise HTTPException(status_code=400, detail="Invalid workout day")
+        if set_data.exercise_name not in routine_exercise_names(workout_day):
+            raise HTTPException(status_code=404, detail="Exercise not found")
+        if set_data.weight is None and set_data.reps is None and set_data.duration_seconds is None:
+            raise HTTPException(status_code=400, detail="A set needs weight, reps or duration_seconds")
+        
+        # Index creation runs in the background and may not have reached it yet
+        await create_exercise_sets_collection()
+        
+        now = datetime.utcnow()
+        if set_data.timestamp:
+            timestamp = set_data.timestamp
+        elif date == now.strftime('%Y-%m-%d'):
+            timestamp = now
+        else:
+            # Back-filled sets are placed on their session's day
+            timestamp = datetime.strptime(date, '%Y-%m-%d')
+        
+        exercise_set = ExerciseSet(
+            date=date,
+            workout_day=workout_day,
+            exercise_name=set_data.exercise_name,
+            weight=set_data.weight,
+            reps=set_data.reps,
+            duration_seconds=set_data.duration_seconds,
+            timestamp=timestamp
         )
+        measurements = {
+            field: getattr(exercise_set, field)
+            for field in ("weight", "reps", "duration_seconds")
+            if getattr(exercise_set, field) is not None
+        }
+        await db.exercise_sets.insert_one({
+            "timestamp": timestamp,
+            "meta": {"exercise": exercise_set.exercise_name, "date": date, "workout_day": workout_day},
+            **measurements
+        })
+        personal_record, new_records = await update_personal_records(exercise_set)
+        await derived_cache.bump("sets")
+        
+        return ExerciseSetResult(set=exercise_set, personal_record=personal_record, new_records=new_records)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@api_router.get("/progress/streak")
-async def get_streak_info():
-    """Get current and longest workout streak"""
+@api_router.get("/workout-session/{date}/{workout_day}/sets", response_model=List[ExerciseSet])
+async def get_session_sets(date: str, workout_day: int):
+    """Get the sets logged for a workout session, in the order they were done"""
     try:
-        # Get all completed workout sessions grouped by date
-        sessions = await db.workout_sessions.find({"completed": True}).sort("date", 1).to_list(1000)
+        docs = await db.exercise_sets.find(
+            {"meta.date": date, "meta.workout_day": workout_day}
+        ).sort("timestamp", 1).to_list(None)
+        return [
+            ExerciseSet(
+                date=date,
+                workout_day=workout_day,
+                exercise_name=doc["meta"]["exercise"],
+                weight=doc.get("weight"),
+                reps=doc.get("reps"),
+                duration_seconds=doc.get("duration_seconds"),
+                timestamp=doc["timestamp"]
+            )
+            for doc in docs
+        ]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.get("/exercises/{exercise_name}/history", response_model=ExerciseHistory)
+async def get_exercise_history(exercise_name: str, weeks: int = Query(52, ge=1, le=MAX_HISTORY_WEEKS)):
+    """Get weekly max weight, reps, duration and volume for an exercise"""
+    try:
+        # Checked before the cache, which would otherwise keep an empty
+        # history for every name requested
+        if not any(exercise_name in routine_exercise_names(day) for day in WORKOUT_ROUTINE):
+            raise HTTPException(status_code=404, detail="Exercise not found")
         
-        if not sessions:
-            return StreakInfo(current_streak=0, longest_streak=0, last_workout_date=None)
+        cache_key = (exercise_name, weeks, datetime.now().date())
+        cache_version = derived_cache.version("sets")
+        cached = derived_cache.get("sets", cache_key)
+        if cached is not None:
+            return cached
         
-        # Group by date and count unique workout days per date
-        workout_dates = {}
-        for session in sessions:
-            date = session["date"]
-            if date not in workout_dates:
-                workout_dates[date] = set()
-            workout_dates[date].add(session["workout_day"])
+        today = datetime.now().date()
+        since = today - timedelta(days=today.weekday()) - timedelta(weeks=weeks - 1)
+        volume = {"$multiply": [{"$ifNull": ["$weight", 0]}, {"$ifNull": ["$reps", 0]}]}
+        rows = await analytics_aggregate("exercise_sets", [
+            {"$match": {
+                "meta.exercise": exercise_name,
+                "timestamp": {"$gte": datetime.combine(since, datetime.min.time())}
+            }},
+            {"$group": {
+                "_id": {"$dateTrunc": {"date": "$timestamp", "unit": "week", "startOfWeek": "monday"}},
+                "sets": {"$sum": 1},
+                "max_weight": {"$max": "$weight"},
+                "max_reps": {"$max": "$reps"},
+                "max_duration_seconds": {"$max": "$duration_seconds"},
+                "volume": {"$sum": volume}
+            }},
+            {"$sort": {"_id": 1}}
+        ])
+        
+        history = ExerciseHistory(
+            exercise_name=exercise_name,
+            weeks=[
+                ExerciseHistoryPoint(
+                    week_start=row["_id"].strftime('%Y-%m-%d'),
+                    sets=row["sets"],
+                    max_weight=row["max_weight"],
+                    max_reps=row["max_reps"],
+                    max_duration_seconds=row["max_duration_seconds"],
+                    volume=row["volume"]
+                )
+                for row in rows
+            ]
+        )
+        derived_cache.set("sets", cache_key, history, cache_version)
+        return history
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.get("/personal-records", response_model=List[PersonalRecord])
+async def get_personal_records():
+    """Get personal records for every exercise with logged sets"""
+    try:
+        docs = await db.personal_records.find().sort("_id", 1).to_list(None)
+        return [
+            PersonalRecord(
+                exercise_name=doc["_id"],
+                achieved_on=doc.get("achieved_on", {}),
+                **{record: doc.get(record) for record in SET_RECORD_FIELDS}
+            )
+            for doc in docs
+        ]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.get("/habits/{date}", response_model=DailyHabits)
+async def get_daily_habits(date: str):
+    """Get daily habits for a specific date"""
+    try:
+        doc = await db.daily_habits.find_one({"date": date})
+        return habits_from_document(doc, date)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.post("/habits", response_model=DailyHabits)
+async def create_daily_habits(habits: DailyHabitsCreate):
+    """Create or overwrite the habit entry for a date"""
+    try:
+        set_mask = sum(bit for name, bit in HABIT_FLAGS.items() if getattr(habits, name))
+        return await write_habits(
+            habits.date, set_mask, ALL_HABITS_MASK & ~set_mask,
+            gym_photo=habits.gym_photo, replace_photo=habits.gym_photo is not None
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.patch("/habits/{date}", response_model=DailyHabits)
+async def update_daily_habits(date: str, habits_update: DailyHabitsUpdate):
+    """Update some habits for a date"""
+    try:
+        changes = habits_update.dict(exclude_unset=True)
+        set_mask = sum(bit for name, bit in HABIT_FLAGS.items() if changes.get(name) is True)
+        clear_mask = sum(bit for name, bit in HABIT_FLAGS.items() if changes.get(name) is False)
+        return await write_habits(
+            date, set_mask, clear_mask,
+            gym_photo=changes.get("gym_photo"), replace_photo="gym_photo" in changes
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def compute_weekly_progress():
+    """Gym, eating and reward progress for the current week"""
+    # Get current week's sessions
+    today = datetime.now().date()
+    cache_key = ("weekly", today)
+    cache_version = derived_cache.version("sessions")
+    cached = derived_cache.get("sessions", cache_key)
+    if cached is not None:
+        return cached
+    
+    week_start = today - timedelta(days=today.weekday())
+    week_dates = [(week_start + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(7)]
+    
+    # Habits and completed sessions for the week in a single round trip:
+    # a day counts for gym if its gym flag is set or a workout was completed
+    has_flags = {"$ifNull": ["$flags", 0]}
+    is_session = {"$ifNull": ["$workout_day", False]}
+    rows = await analytics_aggregate("daily_habits", [
+        {"$match": {"date": {"$in": week_dates}}},
+        {"$project": {"_id": 0, "date": 1, "flags": 1}},
+        {"$unionWith": {
+            "coll": "workout_sessions",
+            "pipeline": [
+                {"$match": {"date": {"$in": week_dates}, **completed_session_filter()}},
+                {"$project": {"_id": 0, "date": 1, "workout_day": 1}}
+            ]
+        }},
+        {"$unionWith": {
+            "coll": "reward_events",
+            "pipeline": [
+                {"$match": {"period": "week", "period_key": week_start.strftime('%Y-%m-%d')}},
+                {"$project": {"_id": 0, "rule_id": 1}}
+            ]
+        }},
+        {"$group": {
+            "_id": "$date",
+            "eating": {"$max": {"$cond": [{"$eq": [{"$mod": [has_flags, EATING_MASK + 1]}, EATING_MASK]}, 1, 0]}},
+            "gym": {"$max": {"$cond": [
+                {"$or": [{"$gte": [{"$mod": [has_flags, ALL_HABITS_MASK + 1]}, HABIT_FLAGS["gym"]]}, is_session]},
+                1, 0
+            ]}},
+            "workouts": {"$sum": {"$cond": [is_session, 1, 0]}},
+            "workout_days": {"$addToSet": "$workout_day"},
+            "rewards": {"$addToSet": "$rule_id"}
+        }},
+        {"$group": {
+            "_id": None,
+            "eating_days": {"$sum": "$eating"},
+            "gym_days": {"$sum": "$gym"},
+            "completed_workouts": {"$sum": "$workouts"},
+            "workout_days": {"$push": "$workout_days"},
+            "rewards": {"$push": "$rewards"}
+        }}
+    ], 1)
+    week = rows[0] if rows else {"eating_days": 0, "gym_days": 0, "completed_workouts": 0, "workout_days": [], "rewards": []}
+    
+    completed_workouts = week["completed_workouts"]
+    workout_days_completed = sorted({day for days in week["workout_days"] for day in days if day is not None})
+    
+    progress_percentage = (completed_workouts / 4) * 100  # 4 workouts target per week
+    progress_percentage = min(progress_percentage, 100)  # Cap at 100%
+    
+    eating_progress = HabitProgress(
+        completed_days=week["eating_days"],
+        total_days=WEEKLY_EATING_TARGET,
+        percentage=min(week["eating_days"] / WEEKLY_EATING_TARGET * 100, 100)
+    )
+    gym_progress = HabitProgress(
+        completed_days=week["gym_days"],
+        total_days=WEEKLY_GYM_TARGET,
+        percentage=min(week["gym_days"] / WEEKLY_GYM_TARGET * 100, 100)
+    )
+    
+    # Rewards are unlocked on write by evaluate_rewards()
+    rewards = reward_labels({rule_id for rule_ids in week["rewards"] for rule_id in rule_ids if rule_id})
+    
+    progress = WeeklyProgress(
+        week_start=week_start.strftime('%Y-%m-%d'),
+        completed_workouts=completed_workouts,
+        total_target=4,
+        progress_percentage=progress_percentage,
+        workout_days_completed=workout_days_completed,
+        rewards_unlocked=rewards,
+        eating_progress=eating_progress,
+        gym_progress=gym_progress,
+        overall_progress=(eating_progress.percentage + gym_progress.percentage) / 2
+    )
+    derived_cache.set("sessions", cache_key, progress, cache_version)
+    return progress
+
+@api_router.get("/progress/weekly")
+async def get_weekly_progress(
+    request: Request, response: Response,
+    fields: Optional[str] = Query(None, description="Comma-separated WeeklyProgress fields to return")
+):
+    """Get weekly gym and eating progress"""
+    try:
+        selected = parse_fields(fields, WeeklyProgress)
+        etag = await progress_etag()
+        if etag_matches(request, etag):
+            return not_modified(etag)
         
-        # Get dates where at least one workout was completed
-        completed_dates = sorted(workout_dates.keys())
+        # One small aggregation serves every field, so only serialization is trimmed
+        progress = await compute_weekly_progress()
+        if selected:
+            return sparse_response(progress.dict(include=selected), {"ETag": etag})
+        response.headers["ETag"] = etag
+        return progress
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def compute_monthly_progress(fields=None):
+    """Workout, streak and reward progress for the current month.
+    
+    With `fields`, only the queries those fields need are run; the other
+    fields are left at placeholder values and must not be returned.
+    """
+    today = datetime.now().date()
+    cache_key = ("monthly", today)
+    cache_version = derived_cache.version("sessions")
+    cached = derived_cache.get("sessions", cache_key)
+    if cached is not None:
+        return cached
+    if fields is not None:
+        cache_key = ("monthly", today, frozenset(fields))
+        cached = derived_cache.get("sessions", cache_key)
+        if cached is not None:
+            return cached
+    wanted = set(MonthlyProgress.model_fields) if fields is None else fields
+    
+    # Calculate target workouts for month (4 per week)
+    target_workouts = monthly_target_workouts(today.year, today.month)
+    
+    async def read_month(database, session):
+        completed_workouts = 0
+        events = []
+        if wanted & {"completed_workouts", "progress_percentage"}:
+            # Get completed workouts this month
+            completed_workouts = await database.workout_sessions.count_documents({
+                "date": {"$regex": f"^{today.strftime('%Y-%m')}"},
+                **completed_session_filter()
+            }, session=session)
         
-        if not completed_dates:
-            return StreakInfo(current_streak=0, longest_streak=0, last_workout_date=None)
+        if "rewards_unlocked" in wanted:
+            # Monthly rewards are unlocked on write by evaluate_rewards()
+            events = await database.reward_events.find(
+                {"period": "month", "period_key": today.strftime('%Y-%m')},
+                {"_id": 0, "rule_id": 1},
+                session=session
+            ).to_list(None)
+        return completed_workouts, events
+    
+    completed_workouts, events = await analytics_read(read_month)
+    
+    progress_percentage = (completed_workouts / target_workouts) * 100 if target_workouts > 0 else 0
+    rewards = reward_labels(event["rule_id"] for event in events)
+    
+    # Calculate streak
+    if wanted & {"current_streak", "longest_streak"}:
+        streak_info = await compute_streak_info()
+    else:
+        streak_info = StreakInfo(current_streak=0, longest_streak=0, last_workout_date=None)
+    
+    progress = MonthlyProgress(
+        month=today.strftime('%Y-%m'),
+        total_workouts=target_workouts,
+        completed_workouts=completed_workouts,
+        progress_percentage=progress_percentage,
+        current_streak=streak_info.current_streak,
+        longest_streak=streak_info.longest_streak,
+        rewards_unlocked=rewards
+    )
+    derived_cache.set("sessions", cache_key, progress, cache_version)
+    return progress
+
+@api_router.get("/progress/monthly")
+async def get_monthly_progress(
+    request: Request, response: Response,
+    fields: Optional[str] = Query(None, description="Comma-separated MonthlyProgress fields to return")
+):
+    """Get monthly gym progress"""
+    try:
+        selected = parse_fields(fields, MonthlyProgress)
+        etag = await progress_etag()
+        if etag_matches(request, etag):
+            return not_modified(etag)
         
-        # Calculate current streak from today backwards
-        current_streak = 0
-        today = datetime.now().date()
-        current_date = today
+        progress = await compute_monthly_progress(selected)
+        if selected:
+            return sparse_response(progress.dict(include=selected), {"ETag": etag})
+        response.headers["ETag"] = etag
+        return progress
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def compute_calendar_heatmap(year):
+    """Completed workouts per day of `year`, reusing cached past months"""
+    today = datetime.now().date()
+    year = year or today.year
+    current_month = today.strftime('%Y-%m')
+    
+    # Fully past months never change unless a past session is edited, so
+    # they are cached until their calendar namespace is invalidated
+    month_days = {}
+    stale_months = {}
+    for month in range(1, 13):
+        month_key = f"{year}-{month:02d}"
+        if month_key < current_month:
+            cached = derived_cache.get(f"calendar:{month_key}", month_key)
+            if cached is not None:
+                month_days[month_key] = cached
+                continue
+        stale_months[month_key] = derived_cache.version(f"calendar:{month_key}")
+    
+    if stale_months:
+        ranges = [
+            {"date": {"$gte": f"{month_key}-01", "$lte": f"{month_key}-31"}}
+            for month_key in stale_months
+        ]
+        rows = await analytics_aggregate("workout_sessions", [
+            {"$match": {"$and": [{"$or": ranges}, completed_session_filter()]}},
+            {"$project": {"_id": 0, "date": 1, "workout_day": 1}},
+            archived_completions_stage(stale_months),
+            # A session caught mid-archival may briefly exist in both tiers
+            {"$group": {"_id": {"date": "$date", "workout_day": "$workout_day"}}},
+            {"$group": {
+                "_id": "$_id.date",
+                "count": {"$sum": 1},
+                "workout_days": {"$addToSet": "$_id.workout_day"}
+            }}
+        ])
         
-        while current_date.strftime('%Y-%m-%d') in completed_dates:
-            current_streak += 1
-            current_date -= timedelta(days=1)
+        computed = {month_key: [] for month_key in stale_months}
+        for row in rows:
+            mask = 0
+            for day in row["workout_days"]:
+                mask |= 1 << day
+            computed[row["_id"][:7]].append((row["_id"], row["count"], mask))
         
-        # Calculate longest streak
-        longest_streak = 0
-        temp_streak = 1
+        for month_key, days in computed.items():
+            days.sort()
+            month_days[month_key] = days
+            if month_key < current_month:
+                derived_cache.set(f"calendar:{month_key}", month_key, days, stale_months[month_key])
+    
+    year_start = date(year, 1, 1)
+    heatmap = CalendarHeatmap(year=year, start=year_start.strftime('%Y-%m-%d'), days=[], counts=[], workout_days=[])
+    for month_key in sorted(month_days):
+        for day, count, mask in month_days[month_key]:
+            heatmap.days.append((datetime.strptime(day, '%Y-%m-%d').date() - year_start).days)
+            heatmap.counts.append(count)
+            heatmap.workout_days.append(mask)
+    return heatmap
+
+@api_router.get("/progress/calendar", response_model=CalendarHeatmap)
+async def get_calendar_progress(
+    request: Request, response: Response, year: Optional[int] = Query(None, ge=1970, le=9999),
+    fields: Optional[str] = Query(None, description="Comma-separated CalendarHeatmap fields to return")
+):
+    """Get per-day completed workouts for a year as a compact heatmap"""
+    try:
+        selected = parse_fields(fields, CalendarHeatmap)
+        year = year or datetime.now().year
+        # Past months are served from their own calendar namespaces
+        etag = await progress_etag(*(f"calendar:{year}-{month:02d}" for month in range(1, 13)))
+        if etag_matches(request, etag):
+            return not_modified(etag)
         
-        if len(completed_dates) > 0:
-            for i in range(1, len(completed_dates)):
-                prev_date = datetime.strptime(completed_dates[i-1], '%Y-%m-%d').date()
-                curr_date = datetime.strptime(completed_dates[i], '%Y-%m-%d').date()
-                
-                if curr_date - prev_date == timedelta(days=1):
-                    temp_streak += 1
-                else:
-                    longest_streak = max(longest_streak, temp_streak)
-                    temp_streak = 1
-            longest_streak = max(longest_streak, temp_streak)
-        
-        return StreakInfo(
-            current_streak=current_streak,
-            longest_streak=longest_streak,
-            last_workout_date=completed_dates[-1] if completed_dates else None
-        )
+        heatmap = await compute_calendar_heatmap(year)
+        if selected:
+            return sparse_response(heatmap.dict(include=selected), {"ETag": etag})
+        response.headers["ETag"] = etag
+        return heatmap
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def compute_streak_info():
+    """Current and longest streak of days with a completed workout"""
+    cache_key = ("streak", datetime.now().date())
+    cache_version = derived_cache.version("sessions")
+    cached = derived_cache.get("sessions", cache_key)
+    if cached is not None:
+        return cached
+    
+    # Get all completed workout sessions grouped by date
+    sessions = await analytics_aggregate("workout_sessions", [
+        {"$match": completed_session_filter()},
+        {"$project": {"_id": 0, "date": 1, "workout_day": 1}},
+        archived_completions_stage(),
+        {"$sort": {"date": 1}}
+    ])
+    
+    if not sessions:
+        return StreakInfo(current_streak=0, longest_streak=0, last_workout_date=None)
+    
+    # Group by date and count unique workout days per date
+    workout_dates = {}
+    for session in sessions:
+        date = session["date"]
+        if date not in workout_dates:
+            workout_dates[date] = set()
+        workout_dates[date].add(session["workout_day"])
+    
+    # Get dates where at least one workout was completed
+    completed_dates = sorted(workout_dates.keys())
+    
+    if not completed_dates:
+        return StreakInfo(current_streak=0, longest_streak=0, last_workout_date=None)
+    
+    # Calculate current streak from today backwards
+    current_streak = 0
+    today = datetime.now().date()
+    current_date = today
+    
+    while current_date.strftime('%Y-%m-%d') in completed_dates:
+        current_streak += 1
+        current_date -= timedelta(days=1)
+    
+    # Calculate longest streak
+    longest_streak = 0
+    temp_streak = 1
+    
+    if len(completed_dates) > 0:
+        for i in range(1, len(completed_dates)):
+            prev_date = datetime.strptime(completed_dates[i-1], '%Y-%m-%d').date()
+            curr_date = datetime.strptime(completed_dates[i], '%Y-%m-%d').date()
+            
+            if curr_date - prev_date == timedelta(days=1):
+                temp_streak += 1
+            else:
+                longest_streak = max(longest_streak, temp_streak)
+                temp_streak = 1
+        longest_streak = max(longest_streak, temp_streak)
+    
+    streak_info = StreakInfo(
+        current_streak=current_streak,
+        longest_streak=longest_streak,
+        last_workout_date=completed_dates[-1] if completed_dates else None
+    )
+    derived_cache.set("sessions", cache_key, streak_info, cache_version)
+    return streak_info
+
+@api_router.get("/progress/streak")
+async def get_streak_info(
+    request: Request, response: Response,
+    fields: Optional[str] = Query(None, description="Comma-separated StreakInfo fields to return")
+):
+    """Get current and longest workout streak"""
+    try:
+        selected = parse_fields(fields, StreakInfo)
+        etag = await progress_etag()
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        
+        streak_info = await compute_streak_info()
+        if selected:
+            return sparse_response(streak_info.dict(include=selected), {"ETag": etag})
+        response.headers["ETag"] = etag
+        return streak_info
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -573,15 +2655,22 @@ async def get_workout(day: int):
         if day not in WORKOUT_ROUTINE:
             raise HTTPException(status_code=404, detail="Invalid day")
         
+        cache_version = derived_cache.version("routine")
+        cached = derived_cache.get("routine", day)
+        if cached is not None:
+            return cached
+        
         workout = WORKOUT_ROUTINE[day]
         exercises = [Exercise(**exercise) for exercise in workout["exercises"]]
         
-        return WorkoutDay(
+        workout_day = WorkoutDay(
             day=day,
             name=workout["name"],
             exercises=exercises,
             is_active=workout["is_active"]
         )
+        derived_cache.set("routine", day, workout_day, cache_version)
+        return workout_day
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -589,6 +2678,11 @@ async def get_workout(day: int):
 async def get_all_workouts():
     """Get all workout days (1-5)"""
     try:
+        cache_version = derived_cache.version("routine")
+        cached = derived_cache.get("routine", "all")
+        if cached is not None:
+            return cached
+        
         workouts = []
         for day in range(1, 6):
             workout = WORKOUT_ROUTINE[day]
@@ -599,13 +2693,29 @@ async def get_all_workouts():
                 exercises=exercises,
                 is_active=workout["is_active"]
             ))
+        derived_cache.set("routine", "all", workouts, cache_version)
         return workouts
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@api_router.get("/metrics")
+async def get_metrics():
+    """Get process-local performance counters"""
+    return metrics
+
+@api_router.get("/metrics/slow-queries")
+async def get_slow_queries():
+    """Get the most recent slow Mongo commands recorded by this process"""
+    return list(slow_query_listener.recent)
+
 # Include the router in the main app
 app.include_router(api_router)
 
+if REQUEST_COALESCING:
+    app.add_middleware(RequestCoalescingMiddleware)
+
+app.add_middleware(ProfilingMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -621,6 +2731,92 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+async def create_unique_indexes():
+    """Indexes that upserts rely on for correctness.
+    
+    Without them concurrent first writes insert duplicates, after which the
+    index can no longer be built, so startup waits for these and fails if
+    they cannot be created.
+    """
+    await db.daily_habits.create_index("date", unique=True)
+    await db.reward_events.create_index([("period", 1), ("period_key", 1), ("rule_id", 1)], unique=True)
+
+async def create_index(collection, keys, **kwargs):
+    try:
+        await collection.create_index(keys, **kwargs)
+    except Exception as e:
+        logger.error(f"Creating index {keys} on {collection.name} failed: {e}")
+
+async def create_indexes():
+    """Query indexes, each created on its own so one failure skips nothing else"""
+    try:
+        await create_exercise_sets_collection()
+    except Exception as e:
+        # Time-series collections need MongoDB 5.0; indexing now would
+        # create a plain collection in its place
+        logger.error(f"Creating the exercise_sets time-series collection failed: {e}")
+    else:
+        await create_index(db.exercise_sets, [("meta.exercise", 1), ("timestamp", 1)])
+        await create_index(db.exercise_sets, [("meta.date", 1), ("meta.workout_day", 1), ("timestamp", 1)])
+    await create_index(db.workout_sessions, [("revision", 1), ("updated_at", 1)])
+    await create_index(db.workout_sessions, [("date", 1), ("workout_day", 1), ("revision", 1)])
+    await create_index(db.scheduler_claims, "claimed_at", expireAfterSeconds=14 * 24 * 3600)
+
+@app.on_event("startup")
+async def require_unique_indexes():
+    try:
+        await create_unique_indexes()
+    except Exception as e:
+        logger.error(f"Unique index creation failed: {e}")
+        raise
+
+@app.on_event("startup")
+async def start_index_build():
+    # Existing indexes are a no-op, but each call is still a round trip and
+    # new ones can take long on big collections: serve requests meanwhile
+    app.state.index_build = asyncio.create_task(create_indexes())
+
+@app.on_event("startup")
+async def evaluate_current_rewards():
+    # Seed unlocks for the current week and month on deployments that
+    # predate the rewards engine; later changes are evaluated on write
+    app.state.reward_seed = asyncio.create_task(evaluate_rewards(datetime.now().strftime('%Y-%m-%d')))
+
+@app.on_event("startup")
+async def start_scheduler():
+    if SCHEDULER_ENABLED:
+        scheduler.start()
+
+@app.on_event("startup")
+async def start_slow_query_log():
+    slow_query_listener.loop = asyncio.get_running_loop()
+
+@app.on_event("startup")
+async def start_cache_sync():
+    app.state.cache_sync = asyncio.create_task(sync_cache_versions())
+
+@app.on_event("startup")
+async def migrate_session_storage_on_startup():
+    if MIGRATE_SESSION_STORAGE:
+        app.state.storage_migration = asyncio.create_task(migrate_session_storage())
+
+@app.on_event("startup")
+async def backfill_session_revisions_on_startup():
+    app.state.revision_backfill = asyncio.create_task(backfill_session_revisions())
+
+@app.on_event("shutdown")
+async def stop_scheduler():
+    scheduler.stop()
+
+@app.on_event("shutdown")
+async def stop_cache_sync():
+    app.state.cache_sync.cancel()
+
+@app.on_event("shutdown")
+async def stop_thumbnail_executor():
+    if thumbnail_executor is not None:
+        thumbnail_executor.shutdown(wait=False)
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
\ No newline at end of file
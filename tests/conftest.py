@@ -0,0 +1,190 @@
+"""Fixtures recording the Mongo commands each API request issues.
+
+The recorder is registered with pymongo.monitoring before server is imported,
+so it sees every command of the server's client. Commands are attributed to
+requests through server.current_route, which ProfilingMiddleware sets and
+Motor carries into its executor threads; background tasks (cache sync,
+startup reward seeding) run without a route and are ignored.
+
+The tests need a reachable MongoDB (MONGO_URL, default localhost) and use a
+throwaway database, BUDGET_TEST_DB_NAME, which is dropped and seeded first.
+They are skipped when no server answers.
+"""
+import os
+import sys
+from dataclasses import dataclass
+from datetime import datetime, time, timedelta
+from pathlib import Path
+
+import pytest
+from dotenv import load_dotenv
+from pymongo import MongoClient, monitoring
+from pymongo.errors import PyMongoError
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+load_dotenv(BACKEND_DIR / ".env")
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+# Never point the tests at the real database: it is dropped below
+os.environ["DB_NAME"] = os.environ.get("BUDGET_TEST_DB_NAME", "habit_tracker_budget_test")
+os.environ["SCHEDULER_ENABLED"] = "false"
+os.environ["CACHE_SYNC_INTERVAL"] = "3600"
+
+# Days of completed sessions seeded up to and including today
+SEED_DAYS = 10
+# Sets of the first exercise of today's workout day: (days ago, weight, reps).
+# Eight days ago is always in an earlier week than today.
+SEED_SETS = [(0, 60.0, 8), (0, 65.0, 6), (0, 70.0, 5), (8, 55.0, 8), (8, 60.0, 8)]
+
+
+@dataclass
+class RecordedCommand:
+    name: str
+    collection: str
+    documents: int
+
+    def __str__(self):
+        return f"{self.name} {self.collection} -> {self.documents} docs"
+
+
+def returned_documents(command_name, reply):
+    cursor = reply.get("cursor")
+    if cursor:
+        return len(cursor.get("firstBatch", cursor.get("nextBatch", [])))
+    if command_name == "findAndModify":
+        return 1 if reply.get("value") else 0
+    if command_name == "distinct":
+        return len(reply.get("values", []))
+    return 0
+
+
+class CommandRecorder(monitoring.CommandListener):
+    IGNORED = {"explain", "endSessions", "hello", "isMaster", "ping"}
+
+    def __init__(self):
+        self.pending = {}
+        self.commands = []
+
+    def reset(self):
+        self.commands = []
+
+    def for_route(self, route):
+        return [command for recorded_route, command in self.commands if recorded_route == route]
+
+    def started(self, event):
+        if event.command_name in self.IGNORED:
+            return
+        collection = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            collection = event.command.get("collection")
+        self.pending[(event.connection_id, event.request_id)] = (
+            server.current_route.get(), event.command_name, str(collection)
+        )
+
+    def succeeded(self, event):
+        pending = self.pending.pop((event.connection_id, event.request_id), None)
+        if pending is None:
+            return
+        route, name, collection = pending
+        self.commands.append((route, RecordedCommand(name, collection, returned_documents(name, event.reply))))
+
+    def failed(self, event):
+        self.pending.pop((event.connection_id, event.request_id), None)
+
+
+recorder = CommandRecorder()
+monitoring.register(recorder)
+
+import server  # noqa: E402  (after register, so its client reports to the recorder)
+
+
+def seed_database(db):
+    today = datetime.now().date()
+    revision = 0
+    for offset in range(SEED_DAYS - 1, -1, -1):
+        day = today - timedelta(days=offset)
+        workout_day = sorted(server.WORKOUT_ROUTINE)[offset % len(server.WORKOUT_ROUTINE)]
+        routine = server.WORKOUT_ROUTINE[workout_day]
+        exercises = [
+            server.ExerciseCompletion(exercise_name=ex["name"], completed=True, timestamp=datetime.utcnow())
+            for ex in routine["exercises"]
+        ]
+        revision += 1
+        session = server.WorkoutSession(
+            date=day.strftime('%Y-%m-%d'),
+            workout_day=workout_day,
+            workout_name=routine["name"],
+            exercises=exercises,
+            completed=True,
+            completion_percentage=100.0,
+            revision=revision
+        )
+        db.workout_sessions.insert_one(server.session_to_document(session))
+    db.counters.insert_one({"_id": "session_revision", "value": revision})
+    db.daily_habits.insert_one({
+        "date": today.strftime('%Y-%m-%d'),
+        "flags": server.EATING_MASK,
+        "updated_at": datetime.utcnow()
+    })
+
+
+def seed_exercise_sets(test_client):
+    """Log SEED_SETS through the API, which creates the time-series collection"""
+    today = datetime.now().date()
+    workout_day = sorted(server.WORKOUT_ROUTINE)[0]
+    exercise = server.routine_exercise_names(workout_day)[0]
+    for index, (days_ago, weight, reps) in enumerate(SEED_SETS):
+        day = today - timedelta(days=days_ago)
+        response = test_client.post(
+            f"/api/workout-session/{day:%Y-%m-%d}/{workout_day}/sets",
+            json={
+                "exercise_name": exercise, "weight": weight, "reps": reps,
+                # Around midday, so the UTC week matches the local one
+                "timestamp": (datetime.combine(day, time(12)) + timedelta(minutes=index)).isoformat()
+            }
+        )
+        response.raise_for_status()
+
+
+@pytest.fixture(scope="session")
+def api():
+    try:
+        probe = MongoClient(os.environ["MONGO_URL"], serverSelectionTimeoutMS=1000)
+        probe.admin.command("ping")
+    except PyMongoError as e:
+        pytest.skip(f"MongoDB is not reachable at {os.environ['MONGO_URL']}: {e}")
+
+    from fastapi.testclient import TestClient
+
+    probe.drop_database(os.environ["DB_NAME"])
+    seed_database(probe[os.environ["DB_NAME"]])
+    with TestClient(server.app) as test_client:
+        async def startup_finished():
+            await server.app.state.index_build
+            await server.app.state.reward_seed
+            await server.app.state.revision_backfill
+
+        # Let startup tasks finish so they do not overlap the first request
+        test_client.portal.call(startup_finished)
+        seed_exercise_sets(test_client)
+        yield test_client
+    probe.drop_database(os.environ["DB_NAME"])
+    probe.close()
+
+
+@pytest.fixture
+def measure(api):
+    """Serve one request and return (response, commands it issued).
+
+    Derived caches are cleared first unless warm=True, so budgets describe
+    the cold path by default.
+    """
+    def run(method, path, warm=False, **kwargs):
+        if not warm:
+            server.derived_cache.entries.clear()
+        recorder.reset()
+        response = api.request(method, path, **kwargs)
+        return response, recorder.for_route(f"{method} {path.split('?')[0]}")
+
+    return run
@@ -0,0 +1,76 @@
+"""Exercise sets against the sets seeded by conftest.py.
+
+Like the budget tests these need MongoDB (5.0 or later, for the time-series
+collection) and are skipped without it, except for input validation that is
+rejected before the database is reached.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+
+import server
+from tests.conftest import SEED_SETS
+
+TODAY = datetime.now().date()
+WORKOUT_DAY = sorted(server.WORKOUT_ROUTINE)[0]
+EXERCISE = server.routine_exercise_names(WORKOUT_DAY)[0]
+
+
+def expected_weeks():
+    weeks = defaultdict(list)
+    for days_ago, weight, reps in SEED_SETS:
+        day = TODAY - timedelta(days=days_ago)
+        weeks[day - timedelta(days=day.weekday())].append((weight, reps))
+    return [
+        {
+            "week_start": week_start.strftime('%Y-%m-%d'),
+            "sets": len(sets),
+            "max_weight": max(weight for weight, _ in sets),
+            "max_reps": max(reps for _, reps in sets),
+            "max_duration_seconds": None,
+            "volume": sum(weight * reps for weight, reps in sets),
+        }
+        for week_start, sets in sorted(weeks.items())
+    ]
+
+
+def test_history_groups_sets_by_monday_week(api):
+    response = api.get(f"/api/exercises/{EXERCISE}/history", params={"weeks": 4})
+    assert response.status_code == 200, response.text
+    assert response.json()["weeks"] == expected_weeks()
+
+
+def test_session_sets_are_returned_in_order(api):
+    response = api.get(f"/api/workout-session/{TODAY:%Y-%m-%d}/{WORKOUT_DAY}/sets")
+    assert response.status_code == 200, response.text
+    today_sets = [(weight, reps) for days_ago, weight, reps in SEED_SETS if days_ago == 0]
+    assert [(row["weight"], row["reps"]) for row in response.json()] == today_sets
+
+
+def test_personal_records_reflect_seeded_sets(api):
+    response = api.get("/api/personal-records")
+    assert response.status_code == 200, response.text
+    record = next(record for record in response.json() if record["exercise_name"] == EXERCISE)
+    assert record["max_weight"] == max(weight for _, weight, _ in SEED_SETS)
+    assert record["max_volume"] == max(weight * reps for _, weight, reps in SEED_SETS)
+
+
+def test_history_of_unknown_exercise_is_not_found():
+    # No lifespan: the name is checked before MongoDB or the cache is touched
+    client = TestClient(server.app)
+    entries = server.derived_cache.entries.get("sets", {}).copy()
+    response = client.get("/api/exercises/Not an exercise/history")
+    assert response.status_code == 404
+    assert server.derived_cache.entries.get("sets", {}) == entries
+
+
+def test_malformed_date_is_rejected():
+    # No lifespan: the date is checked before MongoDB is touched
+    client = TestClient(server.app)
+    for date in ["2026-13-01", "2026-02-30", "2026-1-5", "yesterday"]:
+        response = client.post(
+            f"/api/workout-session/{date}/{WORKOUT_DAY}/sets",
+            json={"exercise_name": EXERCISE, "weight": 50, "reps": 5}
+        )
+        assert response.status_code == 400, (date, response.text)
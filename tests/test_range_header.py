@@ -0,0 +1,36 @@
+"""parse_range_header, used to serve partial photo downloads"""
+import pytest
+
+from server import parse_range_header
+
+LENGTH = 1000
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=990-5000", (990, 999)),  # end is clamped to the last byte
+    ("bytes=-5000", (0, 999)),       # suffix longer than the file
+    ("bytes=999-999", (999, 999)),
+    (" bytes=0-0 ", (0, 0)),
+])
+def test_satisfiable_ranges(header, expected):
+    assert parse_range_header(header, LENGTH) == expected
+
+
+@pytest.mark.parametrize("header", [
+    "bytes=1000-",       # starts past the end
+    "bytes=500-100",     # reversed
+    "bytes=-",
+    "bytes=0-99,200-299",  # multiple ranges are not supported
+    "items=0-99",
+    "bytes=a-b",
+])
+def test_unsatisfiable_or_malformed_ranges(header):
+    assert parse_range_header(header, LENGTH) is None
+
+
+def test_empty_file_has_no_satisfiable_range():
+    assert parse_range_header("bytes=0-", 0) is None
+    assert parse_range_header("bytes=-10", 0) is None
@@ -0,0 +1,183 @@
+"""Per-route budgets for Mongo round trips and documents returned.
+
+Each request is served with cold derived caches (see the measure fixture)
+against the seeded database from conftest.py. A route that issues more
+commands or receives more documents than its budget fails with the list of
+commands it actually ran, so regressions such as a route going back to
+find-then-replace or recomputing the streak show up here rather than as
+latency in production.
+
+When a change legitimately alters a route's access pattern, update its
+budget in the same commit.
+"""
+import difflib
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+import pytest
+
+import server
+from tests.conftest import SEED_DAYS, SEED_SETS
+
+TODAY = datetime.now().strftime('%Y-%m-%d')
+TODAY_WORKOUT_DAY = sorted(server.WORKOUT_ROUTINE)[0]
+FIRST_EXERCISE = server.routine_exercise_names(TODAY_WORKOUT_DAY)[0]
+MONTHLY_RULES = sum(1 for rule in server.REWARD_RULES if rule["period"] == "month")
+TODAY_SETS = sum(1 for days_ago, *_ in SEED_SETS if days_ago == 0)
+SEEDED_SET_WEEKS = len({
+    (datetime.now().date() - timedelta(days=days_ago)).isocalendar()[:2] for days_ago, *_ in SEED_SETS
+})
+
+# Compact sessions are updated with one findAndModify; documents are read
+# and replaced
+EXERCISE_UPDATE_TRIPS = 1 if server.SESSION_STORAGE_FORMAT == "bitmask" else 2
+# evaluate_rewards: week and month counts, archived months, the reward
+# bulk_write (sent as one update and one delete command), then both counts
+# again to detect a concurrent evaluation, and a sessions cache bump when
+# rewards changed
+REWARD_EVALUATION_TRIPS = 2 + 1 + 2 + 2 + 1
+# Each count reads the period's completed sessions, at most a week's and
+# SEED_DAYS, and runs twice
+REWARD_EVALUATION_DOCUMENTS = 2 * (7 + SEED_DAYS)
+
+
+@dataclass
+class Budget:
+    round_trips: int
+    documents: int
+
+
+# Round trips shared by several routes:
+#   progress ETag: 1 find on cache_versions
+#   exercise update: 1 findAndModify on counters + EXERCISE_UPDATE_TRIPS
+#     (+ REWARD_EVALUATION_TRIPS when the session's completion flips)
+#   session cache invalidation: 2 findAndModify on cache_versions
+BUDGETS = {
+    "session": (
+        "GET", f"/api/workout-session/{TODAY}/{TODAY_WORKOUT_DAY}", {},
+        Budget(round_trips=1, documents=1),
+    ),
+    "session, sparse": (
+        "GET", f"/api/workout-session/{TODAY}/{TODAY_WORKOUT_DAY}", {"params": {"fields": "completed"}},
+        Budget(round_trips=1, documents=1),
+    ),
+    "sessions for date": (
+        "GET", f"/api/workout-sessions/{TODAY}", {},
+        # hot sessions + archived months
+        Budget(round_trips=2, documents=1),
+    ),
+    "exercise update": (
+        "PATCH", f"/api/workout-session/{TODAY}/{TODAY_WORKOUT_DAY}/exercise",
+        {"json": {"exercise_name": FIRST_EXERCISE, "completed": True}},
+        Budget(round_trips=1 + EXERCISE_UPDATE_TRIPS + 2, documents=4),
+    ),
+    "sync": (
+        "POST", "/api/sync",
+        {"json": {"cursor": 0, "updates": [{
+            "date": TODAY, "workout_day": TODAY_WORKOUT_DAY,
+            "exercise_name": FIRST_EXERCISE, "completed": True
+        }]}},
+        # existence check + exercise update + invalidation + changed sessions page
+        Budget(round_trips=1 + 1 + EXERCISE_UPDATE_TRIPS + 2 + 1, documents=1 + 4 + SEED_DAYS),
+    ),
+    "habits": (
+        "GET", f"/api/habits/{TODAY}", {},
+        Budget(round_trips=1, documents=1),
+    ),
+    "habits update": (
+        "PATCH", f"/api/habits/{TODAY}", {"json": {"gym": True}},
+        Budget(round_trips=2, documents=2),
+    ),
+    "weekly progress": (
+        "GET", "/api/progress/weekly", {},
+        # ETag + one aggregation over habits, sessions and rewards
+        Budget(round_trips=2, documents=2),
+    ),
+    "monthly progress": (
+        "GET", "/api/progress/monthly", {},
+        # ETag + month session count + month rewards + streak
+        Budget(round_trips=4, documents=1 + 1 + MONTHLY_RULES + SEED_DAYS),
+    ),
+    "monthly progress, count only": (
+        "GET", "/api/progress/monthly", {"params": {"fields": "completed_workouts,progress_percentage"}},
+        # no streak scan, no rewards
+        Budget(round_trips=2, documents=2),
+    ),
+    "calendar": (
+        "GET", "/api/progress/calendar", {},
+        # ETag over sessions and the year's 12 calendar namespaces + one aggregation
+        Budget(round_trips=2, documents=1 + 12 + SEED_DAYS),
+    ),
+    "streak": (
+        "GET", "/api/progress/streak", {},
+        Budget(round_trips=2, documents=1 + SEED_DAYS),
+    ),
+    "session sets": (
+        "GET", f"/api/workout-session/{TODAY}/{TODAY_WORKOUT_DAY}/sets", {},
+        Budget(round_trips=1, documents=TODAY_SETS),
+    ),
+    "exercise history": (
+        "GET", f"/api/exercises/{FIRST_EXERCISE}/history", {"params": {"weeks": 520}},
+        # one weekly $dateTrunc aggregation, whatever the range
+        Budget(round_trips=1, documents=SEEDED_SET_WEEKS),
+    ),
+    "routine day": (
+        "GET", f"/api/workout/{TODAY_WORKOUT_DAY}", {},
+        Budget(round_trips=0, documents=0),
+    ),
+    "routine": (
+        "GET", "/api/workout", {},
+        Budget(round_trips=0, documents=0),
+    ),
+}
+
+
+def budget_report(name, budget, commands):
+    documents = sum(command.documents for command in commands)
+    expected = [f"round trips: {budget.round_trips}", f"documents: {budget.documents}"]
+    actual = [f"round trips: {len(commands)}", f"documents: {documents}"]
+    diff = "\n".join(difflib.unified_diff(expected, actual, "budget", "actual", lineterm=""))
+    log = "\n".join(f"  {i + 1}. {command}" for i, command in enumerate(commands))
+    return f"{name} exceeded its Mongo budget\n{diff}\ncommands:\n{log}"
+
+
+def assert_within_budget(name, budget, commands):
+    documents = sum(command.documents for command in commands)
+    if len(commands) > budget.round_trips or documents > budget.documents:
+        pytest.fail(budget_report(name, budget, commands), pytrace=False)
+
+
+@pytest.mark.parametrize("name", list(BUDGETS))
+def test_route_within_budget(measure, name):
+    method, path, kwargs, budget = BUDGETS[name]
+    response, commands = measure(method, path, **kwargs)
+    assert response.status_code == 200, response.text
+    assert_within_budget(name, budget, commands)
+
+
+def test_cached_progress_costs_one_round_trip(measure):
+    for path in ["/api/progress/weekly", "/api/progress/monthly", "/api/progress/streak"]:
+        measure("GET", path)
+        response, commands = measure("GET", path, warm=True)
+        assert response.status_code == 200, response.text
+        assert_within_budget(f"cached {path}", Budget(round_trips=1, documents=1), commands)
+
+
+def test_completion_flip_within_budget(measure):
+    # Unchecking then re-checking an exercise of a completed session flips
+    # completion both ways, so rewards are re-evaluated each time
+    path = f"/api/workout-session/{TODAY}/{TODAY_WORKOUT_DAY}/exercise"
+    budget = Budget(round_trips=1 + EXERCISE_UPDATE_TRIPS + REWARD_EVALUATION_TRIPS + 2, documents=5 + REWARD_EVALUATION_DOCUMENTS)
+    for completed in [False, True]:
+        response, commands = measure("PATCH", path, json={"exercise_name": FIRST_EXERCISE, "completed": completed})
+        assert response.status_code == 200, response.text
+        assert response.json()["completed"] is completed
+        assert_within_budget(f"completion flip to {completed}", budget, commands)
+
+
+def test_conditional_session_read_is_covered(measure):
+    path = f"/api/workout-session/{TODAY}/{TODAY_WORKOUT_DAY}"
+    etag = measure("GET", path)[0].headers["etag"]
+    response, commands = measure("GET", path, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert_within_budget("conditional session read", Budget(round_trips=1, documents=1), commands)
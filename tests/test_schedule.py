@@ -0,0 +1,41 @@
+"""Next-run functions of the background scheduler"""
+from datetime import datetime
+
+import pytest
+
+from server import daily_at, weekly_at
+
+MONDAY = datetime(2026, 10, 19)
+
+
+@pytest.mark.parametrize("now, expected", [
+    (MONDAY.replace(hour=0, minute=4), MONDAY.replace(hour=0, minute=5)),
+    # A run exactly at the boundary is already due, so the next is tomorrow
+    (MONDAY.replace(hour=0, minute=5), datetime(2026, 10, 20, 0, 5)),
+    (MONDAY.replace(hour=0, minute=5, second=0, microsecond=1), datetime(2026, 10, 20, 0, 5)),
+    (MONDAY.replace(hour=23, minute=59), datetime(2026, 10, 20, 0, 5)),
+    # Month and year rollover
+    (datetime(2026, 12, 31, 12), datetime(2027, 1, 1, 0, 5)),
+])
+def test_daily_at(now, expected):
+    assert daily_at(0, 5)(now) == expected
+
+
+@pytest.mark.parametrize("weekday, now, expected", [
+    (0, MONDAY.replace(hour=0, minute=10), MONDAY.replace(hour=0, minute=15)),
+    (0, MONDAY.replace(hour=0, minute=15), datetime(2026, 10, 26, 0, 15)),
+    (0, datetime(2026, 10, 25, 23, 0), datetime(2026, 10, 26, 0, 15)),  # Sunday night
+    (2, MONDAY.replace(hour=12), datetime(2026, 10, 21, 0, 15)),
+    (6, MONDAY.replace(hour=12), datetime(2026, 10, 25, 0, 15)),
+])
+def test_weekly_at(weekday, now, expected):
+    assert weekly_at(weekday, 0, 15)(now) == expected
+
+
+def test_next_run_is_always_in_the_future():
+    next_run = weekly_at(3, 6, 0)
+    now = MONDAY
+    for _ in range(20):
+        following = next_run(now)
+        assert following > now and following.weekday() == 3
+        now = following
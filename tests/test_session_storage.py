@@ -0,0 +1,180 @@
+"""Session storage formats and the migration between them.
+
+Pure conversions, so these run without MongoDB; the migration is driven
+against a small in-memory stand-in for the workout_sessions collection.
+"""
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+import server
+
+WORKOUT_DAY = sorted(server.WORKOUT_ROUTINE)[0]
+NAMES = server.routine_exercise_names(WORKOUT_DAY)
+DONE_AT = datetime(2026, 3, 2, 7, 30)
+
+
+@pytest.fixture
+def storage_format(monkeypatch):
+    def use(storage_format):
+        monkeypatch.setattr(server, "SESSION_STORAGE_FORMAT", storage_format)
+    return use
+
+
+def make_session(completed_indexes):
+    exercises = [
+        server.ExerciseCompletion(
+            exercise_name=name,
+            completed=i in completed_indexes,
+            timestamp=DONE_AT if i in completed_indexes else None
+        )
+        for i, name in enumerate(NAMES)
+    ]
+    return server.WorkoutSession(
+        date="2026-03-02",
+        workout_day=WORKOUT_DAY,
+        workout_name=server.WORKOUT_ROUTINE[WORKOUT_DAY]["name"],
+        exercises=exercises,
+        completed=server.is_workout_complete(exercises),
+        completion_percentage=server.calculate_completion_percentage(exercises),
+        revision=7
+    )
+
+
+def test_bitmask_document_sets_one_bit_per_completed_exercise(storage_format):
+    storage_format("bitmask")
+    doc = server.session_to_document(make_session({0, 2}))
+    assert doc["completion_mask"] == 0b101
+    assert doc["completion_times"] == [DONE_AT, None, DONE_AT] + [None] * (len(NAMES) - 3)
+    assert "exercises" not in doc and "completed" not in doc
+
+
+@pytest.mark.parametrize("completed_indexes", [set(), {0}, {1, 2}, set(range(len(NAMES)))])
+def test_bitmask_round_trip(storage_format, completed_indexes):
+    storage_format("bitmask")
+    session = make_session(completed_indexes)
+    assert server.session_from_document(server.session_to_document(session)) == session
+
+
+def test_documents_format_round_trip(storage_format):
+    storage_format("documents")
+    session = make_session({1})
+    doc = server.session_to_document(session)
+    assert "completion_mask" not in doc
+    assert server.session_from_document(doc) == session
+
+
+def test_exercises_outside_the_routine_are_not_stored(storage_format):
+    storage_format("bitmask")
+    session = make_session(set(range(len(NAMES))))
+    session.exercises.append(server.ExerciseCompletion(exercise_name="Retired exercise", completed=True))
+    doc = server.session_to_document(session)
+    assert doc["completion_mask"] == server.full_completion_mask(WORKOUT_DAY)
+
+
+def test_completion_from_mask_ignores_bits_beyond_the_routine():
+    extra_bit = 1 << len(NAMES)
+    exercises, completed, percentage = server.completion_from_mask({
+        "workout_day": WORKOUT_DAY,
+        "completion_mask": 0b1 | extra_bit,
+        "completion_times": [DONE_AT]  # shorter than the routine
+    })
+    assert [ex.completed for ex in exercises] == [True] + [False] * (len(NAMES) - 1)
+    assert [ex.timestamp for ex in exercises] == [DONE_AT] + [None] * (len(NAMES) - 1)
+    assert completed is False
+    assert percentage == pytest.approx(100 / len(NAMES))
+
+
+def test_completion_from_mask_full_mask_is_completed():
+    _, completed, percentage = server.completion_from_mask({
+        "workout_day": WORKOUT_DAY,
+        "completion_mask": server.full_completion_mask(WORKOUT_DAY)
+    })
+    assert completed is True
+    assert percentage == 100.0
+
+
+def matches(doc, query):
+    for field, condition in query.items():
+        if isinstance(condition, dict) and "$exists" in condition:
+            if (field in doc) != condition["$exists"]:
+                return False
+        elif doc.get(field) != condition:
+            return False
+    return True
+
+
+class FakeSessions:
+    """The parts of a Motor collection migrate_session_storage uses"""
+    def __init__(self, docs):
+        self.docs = {doc["_id"]: doc for doc in docs}
+        self.batches = []
+
+    async def find(self, query):
+        for doc in list(self.docs.values()):
+            if matches(doc, query):
+                yield doc
+
+    async def bulk_write(self, operations, ordered=True):
+        self.batches.append(len(operations))
+        modified = 0
+        for operation in operations:
+            _id = operation._filter["_id"]
+            if _id in self.docs and matches(self.docs[_id], operation._filter):
+                self.docs[_id] = {"_id": _id, **operation._doc}
+                modified += 1
+        return SimpleNamespace(modified_count=modified)
+
+
+def test_migration_rewrites_only_documents_in_the_old_format(storage_format, monkeypatch):
+    storage_format("documents")
+    legacy = [{"_id": i, **server.session_to_document(make_session({i}))} for i in range(3)]
+    storage_format("bitmask")
+    current = {"_id": 3, **server.session_to_document(make_session({0}))}
+    unknown_day = {**legacy[0], "_id": 4, "workout_day": 99}
+    sessions = FakeSessions([*legacy, current, unknown_day])
+    monkeypatch.setattr(server, "db", type("FakeDatabase", (), {"workout_sessions": sessions}))
+
+    migrated = asyncio.run(server.migrate_session_storage(batch_size=2))
+
+    assert migrated == 3
+    assert sessions.batches == [2, 1]
+    for i in range(3):
+        assert sessions.docs[i]["completion_mask"] == 1 << i
+        assert server.session_from_document(sessions.docs[i]) == server.session_from_document(legacy[i])
+    assert sessions.docs[3] == current
+    # Sessions of days no longer in the routine cannot be encoded and are left alone
+    assert sessions.docs[4] == unknown_day
+
+
+def test_migration_back_to_documents(storage_format, monkeypatch):
+    storage_format("bitmask")
+    compact = {"_id": 1, **server.session_to_document(make_session({0, 1}))}
+    storage_format("documents")
+    sessions = FakeSessions([compact])
+    monkeypatch.setattr(server, "db", type("FakeDatabase", (), {"workout_sessions": sessions}))
+
+    assert asyncio.run(server.migrate_session_storage()) == 1
+    assert "completion_mask" not in sessions.docs[1]
+    assert sessions.docs[1]["exercises"][0]["completed"] is True
+
+
+def test_migration_skips_sessions_written_since_they_were_read(storage_format, monkeypatch):
+    storage_format("documents")
+    legacy = [{"_id": i, **server.session_to_document(make_session(set()))} for i in range(2)]
+    storage_format("bitmask")
+
+    class RacingSessions(FakeSessions):
+        async def bulk_write(self, operations, ordered=True):
+            # An exercise toggle lands between the read and the replace
+            self.docs[1] = {**self.docs[1], "revision": 8, "completion_mask": 0b1}
+            return await super().bulk_write(operations, ordered)
+
+    sessions = RacingSessions(legacy)
+    monkeypatch.setattr(server, "db", type("FakeDatabase", (), {"workout_sessions": sessions}))
+
+    assert asyncio.run(server.migrate_session_storage()) == 1
+    assert sessions.docs[0]["completion_mask"] == 0
+    assert sessions.docs[1]["revision"] == 8 and sessions.docs[1]["completion_mask"] == 0b1